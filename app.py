@@ -1,18 +1,25 @@
 # app.py
 import streamlit as st
-from modules import gsheets, auth, docx_image
+from modules import auth, datastore, google_clients, image_store, metrics, render, timing
+from modules.report import (
+    TEXT_PLACEHOLDERS,
+    build_formatted_data,
+    build_text_values,
+    build_user_data,
+    match_image_slot,
+    normalize_text,
+)
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
-from PIL import Image
-import io
+import hashlib
+import time
 import json
-import re
-import zipfile
 
 PROJECT_DIR = Path(__file__).resolve().parent
 SECRETS_PATH = PROJECT_DIR / ".streamlit" / "secrets.toml"
 SECRETS_EXAMPLE_PATH = PROJECT_DIR / ".streamlit" / "secrets.example.toml"
+TEMPLATE_PATH = PROJECT_DIR / "template.docx"
 
 st.set_page_config(page_title="BBNT - Xã Hội Hóa", layout="wide")
 st.markdown(
@@ -161,7 +168,8 @@ def render_connection_error(error):
             unsafe_allow_html=True,
         )
         if st.button("Tải lại sau khi cấu hình", use_container_width=True):
-            st.cache_data.clear()
+            google_clients.clear()
+            datastore.clear()
             st.rerun()
 
     st.markdown("#### Mẫu `.streamlit/secrets.toml`")
@@ -204,7 +212,8 @@ SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/..."
             config["SPREADSHEET_URL"] = spreadsheet_url.strip()
             write_streamlit_secrets(config)
             st.success("Đã tạo `.streamlit/secrets.toml`. Đang tải lại ứng dụng...")
-            st.cache_data.clear()
+            google_clients.clear()
+            datastore.clear()
             st.rerun()
         except json.JSONDecodeError:
             st.error("Nội dung service account không phải JSON hợp lệ.")
@@ -242,126 +251,57 @@ def write_streamlit_secrets(config):
     SECRETS_PATH.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
 # ---------- load data ----------
-@st.cache_data(ttl=300)
 def load_data():
-    df_csdl, df_taichinh, _ = gsheets.load_dataframes()
-    return df_csdl, df_taichinh
+    # cache dùng chung cả process + snapshot trên đĩa (xem modules/datastore.py)
+    return datastore.get_data(ttl=300)
+
+# endpoint / file Prometheus nếu có BBNT_METRICS_PORT / BBNT_METRICS_FILE (1 lần / process)
+metrics.start_exporter()
+
+# bật ở sidebar ("Đo thời gian xử lý"); đọc trước để đo luôn lần tải dữ liệu của lượt chạy này
+debug_timing = st.session_state.get("debug_timing", False)
 
 try:
-    df_csdl, df_taichinh = load_data()
+    with timing.trace("load_data", enabled=debug_timing or None) as load_trace:
+        df_csdl, df_taichinh, data_index = load_data()
 except Exception as e:
     render_connection_error(e)
     st.stop()
 
-ma_tram_list = [str(v).strip().upper() for v in df_csdl["ma_tram"]]
+tram_index = data_index["tram"]
 
 with st.sidebar:
     st.markdown("### Trạng thái")
-    st.success("Google Sheets đã kết nối")
+    data_status = datastore.status()
+    if data_status["source"] == "snapshot" or data_status["error"] is not None:
+        st.warning("Đang dùng dữ liệu lưu tạm, chưa cập nhật được từ Google Sheets")
+    else:
+        st.success("Google Sheets đã kết nối")
     st.caption(f"CSDL: {len(df_csdl)} dòng")
     st.caption(f"Tài chính: {len(df_taichinh)} dòng")
+    st.checkbox("Đo thời gian xử lý", key="debug_timing")
+    if debug_timing:
+        with st.expander("Thời gian xử lý", expanded=True):
+            if load_trace is not None:
+                st.json(load_trace.to_dict(), expanded=False)
+            last_job = (st.session_state.get("render_job") or {}).get("job")
+            if last_job is not None and last_job.timings is not None:
+                st.json(last_job.timings, expanded=False)
 
 # session
 st.session_state.setdefault("logged_in", False)
+# img{n} -> record trong modules/image_store (chỉ digest + preview nhỏ, bytes nằm trong kho chung)
 st.session_state.setdefault("images", {})
-st.session_state.setdefault("images_bytes", {})
+# img{n} -> (file id của upload, sha256 nội dung) lần xử lý gần nhất
+st.session_state.setdefault("image_uploads", {})
+# file id đã xử lý ở ô upload nhiều ảnh; ảnh chưa đoán được vị trí chờ người dùng chọn
+st.session_state.setdefault("bulk_uploads", set())
+st.session_state.setdefault("unassigned_images", {})
+# [(tên file, lỗi)] của lần upload nhiều ảnh gần nhất, hiện lại sau rerun
+st.session_state.setdefault("bulk_errors", [])
 st.session_state.setdefault("image_upload_mode", "Upload ảnh ngay")
-
-def bytes_from_pil(img: Image.Image):
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=85)
-    return buf.getvalue()
-
-
-DATE_FIELDS = {"ngaybatdau", "ngayketthuc", "ngayky", "tungay", "denngay"}
-MONEY_FIELDS = {
-    "tienthangtruocthue",
-    "tienthueky",
-    "tientruocthueky",
-    "tongtienky",
-}
-
-
-def normalize_key(value):
-    return str(value).lower().replace("_", "").replace(" ", "")
-
-
-def format_vn_number(value, decimals=0):
-    if value is None or (isinstance(value, float) and pd.isna(value)):
-        return ""
-    text = str(value).strip()
-    if not text:
-        return ""
-    try:
-        number = pd.to_numeric(text.replace(".", "").replace(",", "."), errors="raise")
-    except Exception:
-        return text
-    if decimals == 0:
-        return f"{int(round(float(number))):,}".replace(",", ".")
-    formatted = f"{float(number):,.{decimals}f}"
-    return formatted.replace(",", "_").replace(".", ",").replace("_", ".")
-
-
-def format_vn_money(value):
-    return format_vn_number(value, decimals=0)
-
-
-def format_vn_date(value):
-    if value is None or (isinstance(value, float) and pd.isna(value)):
-        return ""
-
-    if isinstance(value, (int, float)) and value > 25000:
-        try:
-            base = pd.to_datetime("1899-12-30")
-            dt = base + pd.to_timedelta(int(value), "D")
-            return dt.strftime("%d/%m/%Y")
-        except Exception:
-            pass
-
-    try:
-        dt = pd.to_datetime(value, dayfirst=True, errors="coerce")
-        if not pd.isna(dt):
-            return dt.strftime("%d/%m/%Y")
-    except Exception:
-        pass
-
-    return str(value)
-
-
-def format_value_for_field(key, value):
-    key_norm = normalize_key(key)
-    if key_norm in MONEY_FIELDS:
-        return format_vn_money(value)
-    if key_norm in DATE_FIELDS:
-        return format_vn_date(value)
-    if key_norm == "kythanhtoan":
-        return format_vn_number(value)
-    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value)
-
-
-def build_formatted_data(data):
-    return {k: format_value_for_field(k, v) for k, v in data.items()}
-
-# ---------- helpers ----------
-from modules.docx_image import _merge_xml  # vẫn dùng
-
-def extract_placeholders_from_docx_bytes(docx_bytes: bytes):
-    """
-    Trả về set placeholder dạng 'ngaybatdau', 'anh1', 'tienthangtruocthue', ...
-    tìm cả $xxx và ${xxx} và trả về tên không đổi (giữ nguyên case có trong file).
-    """
-    bio = io.BytesIO(docx_bytes)
-    with zipfile.ZipFile(bio, "r") as z:
-        xml = z.read("word/document.xml").decode("utf-8")
-
-    xml = _merge_xml(xml)
-
-    # tìm $xxx và ${xxx}
-    s = set()
-    for m in re.finditer(r"\$\{?\s*([A-Za-z0-9_]+)\s*\}?", xml):
-        s.add(m.group(1))
-
-    return s
+# RenderJob đang chạy / vừa xong của session (modules/render)
+st.session_state.setdefault("render_job", None)
 
 # ---------- login ----------
 if not st.session_state.logged_in:
@@ -378,8 +318,7 @@ if not st.session_state.logged_in:
         )
         with st.form("login_form"):
             ma_tram = st.text_input("Mã nhà trạm", placeholder="Ví dụ: AGG001").upper().strip()
-            list_thang = sorted(df_taichinh["Thang"].astype(str).unique().tolist())
-            thang = st.selectbox("Tháng thanh toán", [""] + list_thang)
+            thang = st.selectbox("Tháng thanh toán", [""] + data_index["thang_list"])
             password = st.text_input("Mật khẩu", type="password", placeholder="Nhập mật khẩu")
             submit = st.form_submit_button("Đăng nhập", use_container_width=True)
 
@@ -390,10 +329,10 @@ if not st.session_state.logged_in:
         if not thang:
             st.warning("Chọn tháng thanh toán!")
             st.stop()
-        if ma_tram not in ma_tram_list:
+        if ma_tram not in tram_index:
             st.error("Sai mã trạm!")
             st.stop()
-        idx = ma_tram_list.index(ma_tram)
+        idx = tram_index[ma_tram]
         stored_pw = str(df_csdl["Password"].iloc[idx])
         ok = (auth.verify_password(password, stored_pw) if len(stored_pw) == 64 else stored_pw == password)
         if not ok:
@@ -403,7 +342,11 @@ if not st.session_state.logged_in:
         st.session_state.ma_tram = ma_tram
         st.session_state.thang = thang
         st.session_state.images = {}
-        st.session_state.images_bytes = {}
+        st.session_state.image_uploads = {}
+        st.session_state.render_job = None
+        st.session_state.bulk_uploads = set()
+        st.session_state.unassigned_images = {}
+        st.session_state.bulk_errors = []
         st.rerun()
 
 if not st.session_state.logged_in:
@@ -411,28 +354,15 @@ if not st.session_state.logged_in:
 
 ma_tram = st.session_state.ma_tram
 thang = st.session_state.thang
-idx = ma_tram_list.index(ma_tram)
-csdl_dict = df_csdl.iloc[idx].to_dict()
-
-match = df_taichinh[
-    (df_taichinh["Ma_vi_tri"].astype(str).str.upper() == ma_tram)
-    &
-    (df_taichinh["Thang"].astype(str) == thang)
-]
+idx = tram_index.get(ma_tram)
+match_pos = data_index["thang_rows"].get((ma_tram, thang))
 
-if match.empty:
+if idx is None or match_pos is None:
     st.error("Không tìm thấy dữ liệu tháng.")
     st.stop()
 
-user_data = csdl_dict.copy()
-user_data.update(match.iloc[0].to_dict())
-user_data["Thang"] = thang
-
-# auto fields
-loai_cot = str(user_data.get("Loai_cot", "")).strip().lower()
-user_data["Danh_gia_cot"] = "Đạt" if loai_cot == "cột dây co" else "Không đánh giá"
-user_data["Danh_gia_PM"] = "Đạt" if str(user_data.get("Phong_may","")) != "Không thuê" else "Không đánh giá"
-user_data["Danh_gia_DH"] = "Đạt" if str(user_data.get("Dieu_hoa","")) != "Không thuê" else "Không đánh giá"
+csdl_dict = df_csdl.iloc[idx].to_dict()
+user_data = build_user_data(csdl_dict, df_taichinh.iloc[match_pos].to_dict(), thang)
 formatted_user_data = build_formatted_data(user_data)
 
 overview_tab, image_tab, report_tab = st.tabs(["Thông tin trạm", "Hình ảnh nghiệm thu", "Tạo biên bản"])
@@ -473,16 +403,6 @@ IMAGE_RULES = [
 ]
 
 
-def normalize_text(value):
-    import unicodedata
-
-    text = "" if value is None else str(value)
-    text = text.strip().lower()
-    text = unicodedata.normalize("NFD", text)
-    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
-    return text.replace("đ", "d")
-
-
 def is_rented(value):
     text = normalize_text(value)
     return text not in {"", "nan", "none", "khong", "khong thue", "khong co"}
@@ -518,17 +438,31 @@ def image_rule_status(rule, data):
 
 
 def save_uploaded_image(slot_no, uploaded_file):
-    img = Image.open(uploaded_file).convert("RGB")
-    img.thumbnail((1600, 1600))
+    """
+    Xử lý ảnh upload. file_uploader trả lại cùng file ở mọi lần rerun,
+    nên chỉ decode / resize / encode lại khi file hoặc nội dung thực sự đổi.
+    """
     key = f"img{slot_no}"
-    st.session_state.images[key] = img
-    st.session_state.images_bytes[key] = bytes_from_pil(img)
+    upload_id = getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None)
+    memo = st.session_state.image_uploads.get(key)
+    if memo and upload_id is not None and memo[0] == upload_id:
+        return False
+
+    data = uploaded_file.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    if memo and memo[1] == digest:
+        st.session_state.image_uploads[key] = (upload_id, digest)
+        return False
+
+    st.session_state.images[key] = image_store.ingest(data)
+    st.session_state.image_uploads[key] = (upload_id, digest)
+    return True
 
 
 required_image_rules = get_required_image_rules(user_data)
 uploaded_required_count = sum(
     1 for rule in required_image_rules
-    if f"img{rule['no']}" in st.session_state.images_bytes
+    if f"img{rule['no']}" in st.session_state.images
 )
 
 with st.sidebar:
@@ -544,7 +478,11 @@ with st.sidebar:
     if st.button("Đăng xuất", use_container_width=True):
         st.session_state.logged_in = False
         st.session_state.images = {}
-        st.session_state.images_bytes = {}
+        st.session_state.image_uploads = {}
+        st.session_state.render_job = None
+        st.session_state.bulk_uploads = set()
+        st.session_state.unassigned_images = {}
+        st.session_state.bulk_errors = []
         st.session_state.image_upload_mode = "Upload ảnh ngay"
         st.rerun()
 
@@ -562,10 +500,71 @@ st.markdown(
 def do_rotate(idx, angle):
     key = f"img{idx}"
     if key in st.session_state.images:
-        img = st.session_state.images[key]
-        rotated = img.rotate(angle, expand=True)
-        st.session_state.images[key] = rotated
-        st.session_state.images_bytes[key] = bytes_from_pil(rotated)
+        st.session_state.images[key] = image_store.rotate(st.session_state.images[key], angle)
+
+def process_bulk_upload(files, rules):
+    """
+    Xử lý song song các file mới, tự gán vào ô ảnh theo tên file. Trả về số ảnh đọc được.
+    File lỗi ghi vào bulk_errors để còn hiện sau rerun.
+    """
+    new_files = [
+        f for f in files
+        if (getattr(f, "file_id", None) or f.name) not in st.session_state.bulk_uploads
+    ]
+    if not new_files:
+        return 0
+
+    st.session_state.bulk_errors = []
+    added = 0
+    results = image_store.ingest_many([f.getvalue() for f in new_files])
+    for f, (record, error) in zip(new_files, results):
+        file_key = getattr(f, "file_id", None) or f.name
+        st.session_state.bulk_uploads.add(file_key)
+        if error is not None:
+            st.session_state.bulk_errors.append((f.name, str(error)))
+            continue
+        added += 1
+        slot_no = match_image_slot(f.name, rules)
+        if slot_no is None:
+            st.session_state.unassigned_images[file_key] = {"name": f.name, "record": record}
+        else:
+            st.session_state.images[f"img{slot_no}"] = record
+    return added
+
+
+def assign_image(file_key, slot_no):
+    item = st.session_state.unassigned_images.pop(file_key, None)
+    if item is not None:
+        st.session_state.images[f"img{slot_no}"] = item["record"]
+
+
+def render_bulk_upload(rules):
+    files = st.file_uploader(
+        "Chọn nhiều ảnh cùng lúc (đặt tên file theo số ảnh, vd. anh3.jpg hoặc 3_mong_M0.jpg)",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        key="bulk_upload",
+    )
+    if files and process_bulk_upload(files, rules):
+        st.rerun()
+    for name, error in st.session_state.bulk_errors:
+        st.warning(f"Không đọc được ảnh {name}: {error}")
+
+    if st.session_state.unassigned_images:
+        st.markdown("**Ảnh chưa xác định vị trí**")
+        options = {f"Ảnh {rule['no']} - {rule['title']}": rule["no"] for rule in rules}
+        for file_key, item in list(st.session_state.unassigned_images.items()):
+            col_img, col_pick, col_btn = st.columns([2, 3, 1])
+            with col_img:
+                st.image(item["record"]["preview"], caption=item["name"], width=160)
+            with col_pick:
+                choice = st.selectbox("Gán vào", list(options), key=f"assign_{file_key}")
+            with col_btn:
+                st.button(
+                    "Gán", key=f"assign_btn_{file_key}", use_container_width=True,
+                    on_click=assign_image, args=(file_key, options[choice]),
+                )
+
 
 def render_image_picker(rule, in_dialog=False):
     no = rule["no"]
@@ -580,7 +579,7 @@ def render_image_picker(rule, in_dialog=False):
         st.success("Đã lưu ảnh.")
 
     if key in st.session_state.images:
-        st.image(st.session_state.images[key], width=450)
+        st.image(st.session_state.images[key]["preview"], width=450)
         col_l, col_r = st.columns(2)
         with col_l:
             st.button("⟲", key=f"L{no}_{'dialog' if in_dialog else 'inline'}", on_click=do_rotate, args=(no, 90))
@@ -632,12 +631,14 @@ with image_tab:
         missing_titles = [
             f"Ảnh {rule['no']} - {rule['title']}"
             for rule in required_image_rules
-            if f"img{rule['no']}" not in st.session_state.images_bytes
+            if f"img{rule['no']}" not in st.session_state.images
         ]
         if missing_titles:
             with st.expander("Danh sách ảnh sẽ bổ sung sau", expanded=True):
                 st.write(missing_titles)
     else:
+        render_bulk_upload(required_image_rules)
+
         for rule in required_image_rules:
             i = rule["no"]
             key = f"img{i}"
@@ -648,7 +649,7 @@ with image_tab:
                 if has_image:
                     col1, col2, col3, col4 = st.columns([4, 1, 1, 1])
                     with col1:
-                        st.image(st.session_state.images[key], width=450)
+                        st.image(st.session_state.images[key]["preview"], width=450)
                     with col2:
                         st.button("⟲", key=f"L{i}", on_click=do_rotate, args=(i, 90), use_container_width=True)
                     with col3:
@@ -676,6 +677,18 @@ with image_tab:
 from modules import docx_image_safe as ds
 
 
+def current_report_inputs():
+    """(text_values, images, upload_later) của biên bản theo dữ liệu / ảnh hiện tại trong session."""
+    text_values = render.text_values_for(TEMPLATE_PATH, build_text_values(user_data))
+    images = {
+        rule["no"]: (rule["title"], st.session_state.images[f"img{rule['no']}"])
+        for rule in required_image_rules
+        if f"img{rule['no']}" in st.session_state.images
+    }
+    upload_later = st.session_state.get("image_upload_mode") == "Để upload sau"
+    return text_values, images, upload_later
+
+
 with report_tab:
     st.subheader("Tạo biên bản")
     st.caption("Kiểm tra nhanh trước khi xuất file Word.")
@@ -691,99 +704,75 @@ with report_tab:
     else:
         st.warning("Chưa đủ ảnh bắt buộc. Vui lòng hoàn tất ở tab Hình ảnh nghiệm thu.")
 
+    # template sửa sai tên trường thì báo ngay, không đợi người dùng phát hiện trong file Word
+    manifest = ds.template_manifest(TEMPLATE_PATH, TEXT_PLACEHOLDERS)
+    if manifest["missing"]:
+        st.caption("Template không có trường: " + ", ".join(manifest["missing"]))
+    if manifest["unknown"]:
+        st.warning("Template có trường không xác định: " + ", ".join(sorted(manifest["unknown"])))
+
 if report_tab.button("📄 Tạo & Tải biên bản", use_container_width=True):
     try:
         missing_images = [
             f"Ảnh {rule['no']} - {rule['title']} * (bắt buộc)"
             for rule in required_image_rules
-            if f"img{rule['no']}" not in st.session_state.images_bytes
+            if f"img{rule['no']}" not in st.session_state.images
         ]
         upload_later = st.session_state.get("image_upload_mode") == "Để upload sau"
         if missing_images and not upload_later:
             st.error("Vui lòng chọn đủ ảnh trước khi tạo biên bản:")
             st.write(missing_images)
             st.stop()
-        if missing_images and upload_later:
-            st.warning("Biên bản sẽ được tạo trước, các ảnh sau đây cần bổ sung sau:")
-            st.write(missing_images)
 
-        with st.spinner("Đang tạo biên bản..."):
-
-            # Load template docx
-            with open("template.docx", "rb") as f:
-                docx_bytes = f.read()
-
-            doc = ds.load_docx_bytes(docx_bytes)
-
-            # Chuẩn hoá dữ liệu user_data
-            normalized_map = {}
-
-            for k, v in user_data.items():
-                key = normalize_key(k)
-                normalized_map[key] = format_value_for_field(k, v)
-
-            # Danh sách placeholders trong template:
-            holders = [
-                # text placeholders
-                "ngaybatdau", "ngayketthuc", "ngay_ky", "tu_ngay", "den_ngay",
-                "Chu_ha_tang", "Chuc_vu",
-                "Danh_gia_DH","Danh_gia_PM","Danh_gia_cot",
-                "Dia_chi","Ky_thanh_toan",
-                "Loai_cot","Loai_tram",
-                "Ma_HD","Ten_GD_VT","Ten_don_vi_XHH",
-                "ma_tram","tien_bang_chu",
-                "tienthangtruocthue","tienthueky",
-                "tientruocthueky","tongtienky"
-            ]
-
-            # --- Replace text placeholders ---
-            for holder in holders:
-                key_norm = holder.lower().replace("_","")
-                value = normalized_map.get(key_norm, "")
-
-                # replace 4 dạng
-                ds.replace_text(doc, f"${holder}", value)
-                ds.replace_text(doc, f"${{{holder}}}", value)
-                ds.replace_text(doc, f"${holder};", value)
-                ds.replace_text(doc, f"${{{holder}}};", value)
-
-            # --- Insert images ---
-            for rule in required_image_rules:
-                i = rule["no"]
-                key = f"img{i}"
-                if key not in st.session_state.images_bytes:
-                    continue
-                img_bytes = st.session_state.images_bytes[key]
-
-                inserted = False
-                for ph in [
-                    f"${{Anh{i}}}",
-                    f"$Anh{i}",
-                    f"${{anh{i}}}",
-                    f"$anh{i}",
-                    f"Ảnh {i}",
-                    f"ảnh {i}",
-                    f"Anh {i}",
-                    f"anh {i}",
-                ]:
-                    inserted = ds.insert_image(doc, ph, img_bytes, 12) or inserted
-
-                if not inserted:
-                    ds.insert_image_in_final_table(doc, i, rule["title"], img_bytes, 12)
-
-            # Save lại DOCX
-            out_bytes = ds.save_docx(doc)
-
-            title = f"BBNT_{ma_tram}_{thang}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-
-            st.download_button(
-                "📥 Tải DOCX",
-                data=out_bytes,
-                file_name=title + ".docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
+        text_values, images, upload_later = current_report_inputs()
+        # render ở thread nền; bấm lại / rerun trong lúc chờ không làm mất job
+        st.session_state.render_job = {
+            "job": render.submit(
+                TEMPLATE_PATH, text_values, images, upload_later, timed=st.session_state.get("debug_timing", False),
+            ),
+            "title": f"BBNT_{ma_tram}_{thang}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            # hiện cùng thanh tiến trình / nút tải, không bị rerun xoá mất
+            "missing_images": missing_images if upload_later else [],
+        }
 
     except Exception as e:
         import traceback
         st.error(f"Lỗi tạo biên bản: {e}")
         st.text(traceback.format_exc())
+
+RENDER_STAGE_LABELS = {
+    "queued": "Đang chờ tới lượt...",
+    "load": "Đang mở template...",
+    "text": "Đang điền thông tin...",
+    "images": "Đang chèn ảnh...",
+    "save": "Đang lưu file...",
+    "done": "Đã xong.",
+}
+
+render_job = st.session_state.get("render_job")
+if render_job is not None:
+    job = render_job["job"]
+    # đổi ảnh / xoay ảnh / đổi chế độ upload sau khi bấm tạo → file của job không còn đúng
+    if job.key != render.report_key(ds.template_digest(TEMPLATE_PATH), *current_report_inputs()):
+        st.session_state.render_job = render_job = None
+        report_tab.info("Ảnh hoặc thông tin đã thay đổi sau lần tạo trước, bấm tạo lại để tải biên bản mới.")
+
+if render_job is not None:
+    with report_tab:
+        if render_job.get("missing_images"):
+            st.warning("Biên bản được tạo trước, các ảnh sau đây cần bổ sung sau:")
+            st.write(render_job["missing_images"])
+        if not job.done():
+            st.progress(job.progress, text=RENDER_STAGE_LABELS[job.stage])
+            time.sleep(0.4)
+            st.rerun()
+        elif job.error() is not None:
+            st.error(f"Lỗi tạo biên bản: {job.error()}")
+            st.session_state.render_job = None
+        else:
+            st.download_button(
+                "📥 Tải DOCX",
+                data=job.result(),
+                file_name=render_job["title"] + ".docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
@@ -0,0 +1,129 @@
+# modules/batch.py
+"""
+Tạo BBNT hàng loạt cho 1 tháng, tất cả các trạm (không cần đăng nhập / Streamlit UI).
+
+    python -m modules.batch --thang 2026-09 --out out/
+
+Biên bản tạo ra chỉ có phần chữ (giống chế độ "Để upload sau"), ảnh bổ sung sau.
+"""
+import argparse
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from modules import gsheets
+from modules.docx_image import CompiledTemplate
+from modules.report import (
+    DATA_FIELDS,
+    TEXT_PLACEHOLDERS,
+    build_data_index,
+    build_text_values,
+    build_user_data,
+)
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_TEMPLATE = PROJECT_DIR / "template.docx"
+
+# template đã compile, mỗi worker process giữ 1 bản
+_template = None
+
+
+def _init_worker(template_bytes):
+    global _template
+    _template = CompiledTemplate(template_bytes, TEXT_PLACEHOLDERS)
+
+
+def _render_one(ma_tram, values):
+    return ma_tram, _template.render(values)
+
+
+def _safe_name(value):
+    return re.sub(r"[^\w.-]+", "-", str(value)).strip("-")
+
+
+def iter_jobs(df_csdl, df_taichinh, thang):
+    """
+    Ghép CSDL + Taichinh như app.py, trả về (ma_tram, values) cho từng trạm có dữ liệu tháng.
+    """
+    index = build_data_index(df_csdl, df_taichinh)
+    for (ma_tram, row_thang), pos in index["thang_rows"].items():
+        if row_thang != thang or ma_tram not in index["tram"]:
+            continue
+        user_data = build_user_data(
+            df_csdl.iloc[index["tram"][ma_tram]].to_dict(),
+            df_taichinh.iloc[pos].to_dict(),
+            thang,
+        )
+        yield ma_tram, build_text_values(user_data)
+
+
+def run_batch(df_csdl, df_taichinh, thang, out_dir, template_path=DEFAULT_TEMPLATE, workers=None):
+    workers = workers or os.cpu_count() or 1
+    with open(template_path, "rb") as f:
+        template_bytes = f.read()
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = out_dir / f"BBNT_{_safe_name(thang)}.zip"
+
+    jobs = iter_jobs(df_csdl, df_taichinh, thang)
+    count = 0
+    total_bytes = 0
+    started = time.perf_counter()
+
+    # docx đã nén sẵn → ZIP_STORED; giới hạn số job đang chạy để ghi dần ra zip
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zout, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(template_bytes,)) as pool:
+        pending = set()
+        for ma_tram, values in jobs:
+            pending.add(pool.submit(_render_one, ma_tram, values))
+            if len(pending) < workers * 4:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, data = fut.result()
+                zout.writestr(f"BBNT_{_safe_name(name)}_{_safe_name(thang)}.docx", data)
+                count += 1
+                total_bytes += len(data)
+
+        for fut in wait(pending).done:
+            name, data = fut.result()
+            zout.writestr(f"BBNT_{_safe_name(name)}_{_safe_name(thang)}.docx", data)
+            count += 1
+            total_bytes += len(data)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "zip_path": str(zip_path),
+        "reports": count,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "reports_per_second": count / elapsed if elapsed > 0 else 0.0,
+        "workers": workers,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tạo BBNT hàng loạt cho 1 tháng.")
+    parser.add_argument("--thang", required=True, help="Tháng thanh toán, đúng như cột Thang trong sheet Taichinh")
+    parser.add_argument("--out", required=True, help="Thư mục ghi file zip")
+    parser.add_argument("--template", default=str(DEFAULT_TEMPLATE))
+    parser.add_argument("--workers", type=int, default=None, help="Số process (mặc định: số CPU)")
+    args = parser.parse_args(argv)
+
+    df_csdl, df_taichinh, _ = gsheets.load_dataframes(fields=DATA_FIELDS)
+    stats = run_batch(df_csdl, df_taichinh, args.thang, args.out, args.template, args.workers)
+
+    print(f"Đã tạo {stats['reports']} biên bản → {stats['zip_path']}")
+    print(
+        f"{stats['seconds']:.2f}s, {stats['reports_per_second']:.1f} biên bản/s, "
+        f"{stats['workers']} process, {stats['bytes'] / 1024 / 1024:.1f} MB"
+    )
+    return 0 if stats["reports"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
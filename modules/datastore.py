@@ -0,0 +1,273 @@
+# modules/datastore.py
+"""
+Dữ liệu CSDL/Taichinh dùng chung trong process.
+
+- Mỗi lần tải từ Google xong sẽ ghi snapshot SQLite ra đĩa (kèm version stamp + id spreadsheet).
+  Snapshot có cột Password → file chỉ chủ process đọc được (0600).
+- Process mới khởi động đọc snapshot ngay, tải lại từ Google ở thread nền.
+- Hết TTL: vẫn trả bản cũ ngay, đúng 1 thread nền tải bản mới (stale-while-revalidate).
+- Google lỗi / chậm thì vẫn phục vụ bản đang có (chỉ đọc), lần thử sau giãn dần (backoff).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from modules import google_clients, gsheets, metrics, timing
+from modules.report import DATA_FIELDS, build_data_index
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+SNAPSHOT_PATH = PROJECT_DIR / ".cache" / "sheets.sqlite"
+SNAPSHOT_FORMAT = 1
+TTL = 300
+RETRY_MIN = 15
+RETRY_MAX = 600
+
+_STATE = {
+    "data": None,        # (df_csdl, df_taichinh, index)
+    "loaded_at": 0.0,    # time.time() lần nạp dữ liệu gần nhất
+    "source": None,      # "google" | "snapshot"
+    "version": None,
+    "source_version": None,  # version file trên Drive lúc tải, để bỏ qua lần tải khi sheet không đổi
+    "error": None,
+    "failures": 0,       # số lần refresh lỗi liên tiếp
+    "retry_at": 0.0,     # chưa thử lại trước thời điểm này
+}
+_LOCK = threading.Lock()
+# chỉ 1 lần tải từ Google tại 1 thời điểm (single-flight)
+_FETCH_LOCK = threading.Lock()
+_refresh_thread = None
+
+CACHE_REQUESTS = metrics.counter(
+    "bbnt_cache_requests_total", "Số lần đọc cache theo kết quả", ["cache", "result"],
+)
+REFRESHES = metrics.counter(
+    "bbnt_sheets_refresh_total", "Số lần tải lại dữ liệu Google Sheets", ["outcome"],
+)
+
+
+# ---------- snapshot ----------
+def data_version(df_csdl, df_taichinh) -> str:
+    h = hashlib.sha256()
+    for df in (df_csdl, df_taichinh):
+        h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+
+def _write_table(con, name, df):
+    # BLOB affinity: sqlite giữ nguyên int/float/str như get_all_records trả về
+    df.to_sql(name, con, index=False, dtype={c: "BLOB" for c in df.columns})
+
+
+def save_snapshot(df_csdl, df_taichinh, version=None, path=SNAPSHOT_PATH, source_version=None,
+                  spreadsheet_id=None, column_layout=None):
+    path = Path(path)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    # tạo file trước với quyền 0600 rồi mới để sqlite ghi vào (journal cũng theo quyền của file)
+    os.close(os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+
+    con = sqlite3.connect(tmp)
+    try:
+        _write_table(con, "csdl", df_csdl)
+        _write_table(con, "taichinh", df_taichinh)
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("format", str(SNAPSHOT_FORMAT)),
+            ("version", version or data_version(df_csdl, df_taichinh)),
+            ("saved_at", datetime.now().isoformat(timespec="seconds")),
+            ("source_version", source_version or ""),
+            ("spreadsheet_id", spreadsheet_id or ""),
+            ("column_layout", json.dumps(column_layout or {}, ensure_ascii=False)),
+        ])
+        con.commit()
+    finally:
+        con.close()
+    # ghi file tạm rồi đổi tên → process khác không bao giờ đọc phải file dở dang
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=SNAPSHOT_PATH, spreadsheet_id=None):
+    """
+    Trả về (df_csdl, df_taichinh, meta) hoặc None nếu chưa có / hỏng / khác format
+    / của spreadsheet khác (vd. vừa đổi SPREADSHEET_URL).
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT key, value FROM meta").fetchall())
+            if meta.get("format") != str(SNAPSHOT_FORMAT):
+                return None
+            if not spreadsheet_id or meta.get("spreadsheet_id") != spreadsheet_id:
+                return None
+            df_csdl = pd.read_sql_query("SELECT * FROM csdl", con)
+            df_taichinh = pd.read_sql_query("SELECT * FROM taichinh", con)
+        finally:
+            con.close()
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        return None
+    return df_csdl, df_taichinh, meta
+
+
+def _current_spreadsheet_id():
+    try:
+        return gsheets.spreadsheet_id_from_url(google_clients.get_gcp_config()["SPREADSHEET_URL"])
+    except Exception:
+        return None
+
+
+# ---------- process cache ----------
+def _set_data(df_csdl, df_taichinh, source, version, loaded_at, source_version=None):
+    data = (df_csdl, df_taichinh, build_data_index(df_csdl, df_taichinh))
+    with _LOCK:
+        _STATE.update(
+            data=data, source=source, version=version, loaded_at=loaded_at,
+            source_version=source_version, error=None,
+        )
+    return data
+
+
+def _record_failure(exc):
+    with _LOCK:
+        _STATE["failures"] += 1
+        delay = min(RETRY_MAX, RETRY_MIN * 2 ** (_STATE["failures"] - 1))
+        _STATE.update(error=exc, retry_at=time.time() + delay)
+
+
+def _fetch():
+    with _LOCK:
+        known = _STATE["source_version"] if _STATE["data"] is not None else None
+
+    spreadsheet_id = _current_spreadsheet_id()
+    loaded, source_version = gsheets.load_dataframes_if_changed(
+        known, spreadsheet_id=spreadsheet_id, fields=DATA_FIELDS,
+    )
+    REFRESHES.inc(outcome="unchanged" if loaded is None else "loaded")
+    if loaded is None:
+        # sheet không đổi → giữ nguyên dữ liệu, chỉ gia hạn TTL
+        with _LOCK:
+            _STATE.update(source="google", loaded_at=time.time(), error=None, failures=0, retry_at=0.0)
+            return _STATE["data"]
+
+    df_csdl, df_taichinh, _ = loaded
+    version = data_version(df_csdl, df_taichinh)
+    data = _set_data(df_csdl, df_taichinh, "google", version, time.time(), source_version)
+    with _LOCK:
+        _STATE.update(failures=0, retry_at=0.0)
+    try:
+        save_snapshot(
+            df_csdl, df_taichinh, version, source_version=source_version, spreadsheet_id=spreadsheet_id,
+            column_layout=gsheets.column_layout(spreadsheet_id),
+        )
+    except (OSError, sqlite3.Error):
+        # không ghi được snapshot thì lần khởi động sau tải từ Google như cũ
+        pass
+    return data
+
+
+def refresh():
+    """Tải lại từ Google (đồng bộ), cập nhật cache + snapshot."""
+    with _FETCH_LOCK:
+        return _fetch()
+
+
+def _background_refresh():
+    try:
+        refresh()
+    except Exception as exc:
+        REFRESHES.inc(outcome="error")
+        _record_failure(exc)
+
+
+def start_background_refresh():
+    global _refresh_thread
+    with _LOCK:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        if time.time() < _STATE["retry_at"]:
+            return
+        _refresh_thread = threading.Thread(target=_background_refresh, name="sheets-refresh", daemon=True)
+        _refresh_thread.start()
+
+
+def get_data(ttl=TTL):
+    """
+    (df_csdl, df_taichinh, index) cho request hiện tại.
+    Lần đầu trong process: lấy snapshot nếu có và tải lại ở nền, không có thì tải đồng bộ.
+    """
+    with timing.stage("datastore.get_data") as s:
+        with _LOCK:
+            data = _STATE["data"]
+            loaded_at = _STATE["loaded_at"]
+
+        if data is None:
+            result = "cold_start"
+        elif time.time() - loaded_at >= ttl:
+            result = "stale"
+        else:
+            result = "hit"
+        s.set(result=result)
+        CACHE_REQUESTS.inc(cache="sheets_data", result=result)
+
+        if data is None:
+            return _cold_start()
+        if result == "stale":
+            # trả bản cũ ngay, bản mới sẽ có ở lần gọi sau
+            start_background_refresh()
+        return data
+
+
+def _cold_start():
+    # nhiều session cùng vào lúc process mới chạy → chỉ 1 session tải, các session khác chờ kết quả
+    with _FETCH_LOCK:
+        with _LOCK:
+            if _STATE["data"] is not None:
+                return _STATE["data"]
+
+        spreadsheet_id = _current_spreadsheet_id()
+        snap = load_snapshot(spreadsheet_id=spreadsheet_id)
+        if snap is None:
+            return _fetch()
+        df_csdl, df_taichinh, meta = snap
+        # lần tải nền sau đó chỉ đọc các cột cần, không phải đọc cả sheet để dò header
+        try:
+            gsheets.seed_column_layout(spreadsheet_id, json.loads(meta.get("column_layout") or "{}"))
+        except (ValueError, TypeError):
+            pass
+        data = _set_data(
+            df_csdl, df_taichinh, "snapshot", meta.get("version"), 0.0, meta.get("source_version") or None,
+        )
+
+    # snapshot có thể đã cũ → coi như hết hạn, tải lại ở nền
+    start_background_refresh()
+    return data
+
+
+def status():
+    with _LOCK:
+        return {k: v for k, v in _STATE.items() if k != "data"}
+
+
+def clear():
+    """Bỏ dữ liệu trong process và snapshot trên đĩa (vd. sau khi đổi cấu hình / SPREADSHEET_URL)."""
+    with _LOCK:
+        _STATE.update(
+            data=None, loaded_at=0.0, source=None, version=None, source_version=None,
+            error=None, failures=0, retry_at=0.0,
+        )
+    try:
+        SNAPSHOT_PATH.unlink(missing_ok=True)
+    except OSError:
+        pass
@@ -1,15 +1,211 @@
 import io
 import zipfile
 import re
+import struct
 import uuid
+import zlib
+from xml.sax.saxutils import escape
 from docx import Document
 from docx.shared import Cm
+
+from modules.docx_image_safe import _compile_placeholders
 #verify that the required libraries are installed
 def _merge_xml(xml: str) -> str:
     xml = re.sub(r"</w:t>\s*<w:t[^>]*>", "", xml)
     xml = re.sub(r"</w:t><w:t[^>]*>", "", xml)
     return xml
 
+
+# ---------- compiled template ----------
+# part co the chua placeholder; cac part khac copy nguyen (da nen san)
+_TEMPLATE_PARTS = re.compile(r"word/(document|header\d*|footer\d*)\.xml$")
+_PARAGRAPH_RE = re.compile(r"<w:p[ >].*?</w:p>", re.S)
+_WT_RE = re.compile(r"(<w:t(?:\s[^>]*)?>)([^<]*)(</w:t>)")
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+
+
+def _normalize_paragraph(p_xml, pattern):
+    """
+    Gom placeholder bi Word cat qua nhieu <w:t> ve <w:t> chua dau "$".
+    Tra ve xml paragraph moi.
+    """
+    while True:
+        nodes = list(_WT_RE.finditer(p_xml))
+        if len(nodes) < 2:
+            return p_xml
+
+        texts = [m.group(2) for m in nodes]
+        starts = []
+        pos = 0
+        for t in texts:
+            starts.append(pos)
+            pos += len(t)
+
+        for m in pattern.finditer("".join(texts)):
+            first = max(i for i, st in enumerate(starts) if st <= m.start())
+            last = max(i for i, st in enumerate(starts) if st < m.end())
+            if first != last:
+                break
+        else:
+            return p_xml
+
+        # dua toan bo placeholder vao node dau, cat phan thua o cac node sau
+        for i in range(first, last + 1):
+            lo = max(m.start(), starts[i]) - starts[i]
+            hi = min(m.end(), starts[i] + len(texts[i])) - starts[i]
+            piece = m.group(0) if i == first else ""
+            texts[i] = texts[i][:lo] + piece + texts[i][hi:]
+        p_xml = _rebuild(p_xml, nodes, texts)
+
+
+def _rebuild(p_xml, nodes, texts):
+    out = []
+    last = 0
+    for m, text in zip(nodes, texts):
+        out.append(p_xml[last:m.start()])
+        out.append(m.group(1) + text + m.group(3))
+        last = m.end()
+    out.append(p_xml[last:])
+    return "".join(out)
+
+
+def _preserve_space(open_tag):
+    if "xml:space" in open_tag:
+        return open_tag
+    return open_tag[:-1] + ' xml:space="preserve">'
+
+
+def _compile_part(xml, pattern):
+    """
+    Tach xml thanh (segments, slots): segments[i] la bytes tinh,
+    slots[i] = (ten, text goc). Len(segments) == len(slots) + 1.
+    """
+    xml = _merge_xml(xml)
+    xml = _PARAGRAPH_RE.sub(lambda m: _normalize_paragraph(m.group(0), pattern), xml)
+
+    segments = []
+    slots = []
+    buf = []
+    last = 0
+    for wt in _WT_RE.finditer(xml):
+        text = wt.group(2)
+        found = list(pattern.finditer(text))
+        if not found:
+            continue
+        buf.append(xml[last:wt.start()])
+        buf.append(_preserve_space(wt.group(1)))
+        t_last = 0
+        for m in found:
+            buf.append(text[t_last:m.start()])
+            segments.append("".join(buf).encode("utf-8"))
+            buf = []
+            slots.append((m.group(1) or m.group(2), m.group(0)))
+            t_last = m.end()
+        buf.append(text[t_last:])
+        buf.append(wt.group(3))
+        last = wt.end()
+    buf.append(xml[last:])
+    segments.append("".join(buf).encode("utf-8"))
+    return segments, slots
+
+
+def _read_raw_member(docx_bytes, info):
+    # local header: 30 byte co dinh + ten + extra, sau do la data da nen
+    offset = info.header_offset
+    name_len, extra_len = struct.unpack("<2H", docx_bytes[offset + 26:offset + 30])
+    start = offset + 30 + name_len + extra_len
+    return docx_bytes[start:start + info.compress_size]
+
+
+class CompiledTemplate:
+    """
+    Template docx đọc 1 lần: các part có placeholder ($key, ${key}, chỉ với key
+    trong `keys`) được tách thành segment tĩnh + slot, các part còn lại giữ
+    nguyên bytes đã nén.
+    render() chỉ nối chuỗi, nén lại part có slot và copy raw phần còn lại.
+    """
+
+    def __init__(self, docx_bytes: bytes, keys, compresslevel: int = 6):
+        pattern = _compile_placeholders(keys)
+        self.compresslevel = compresslevel
+        self.members = []
+        with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+            for info in zin.infolist():
+                member = {"info": info, "parts": None, "raw": None}
+                if _TEMPLATE_PARTS.match(info.filename):
+                    xml = zin.read(info.filename).decode("utf-8")
+                    segments, slots = _compile_part(xml, pattern)
+                    if slots:
+                        member["parts"] = (segments, slots)
+                if member["parts"] is None:
+                    member["raw"] = _read_raw_member(docx_bytes, info)
+                self.members.append(member)
+
+    @property
+    def slots(self):
+        names = []
+        for member in self.members:
+            if member["parts"]:
+                names.extend(name for name, _ in member["parts"][1])
+        return names
+
+    def _render_part(self, parts, values):
+        segments, slots = parts
+        out = [segments[0]]
+        for (name, original), seg in zip(slots, segments[1:]):
+            if name in values:
+                value = values[name]
+                out.append(escape("" if value is None else str(value)).encode("utf-8"))
+            else:
+                out.append(original.encode("utf-8"))
+            out.append(seg)
+        return b"".join(out)
+
+    def render(self, values: dict) -> bytes:
+        """
+        values: {tên_placeholder: giá_trị}. Slot không có trong values giữ nguyên text gốc.
+        """
+        out = io.BytesIO()
+        central = []
+        for member in self.members:
+            info = member["info"]
+            if member["parts"] is None:
+                data = member["raw"]
+                compress_type = info.compress_type
+                crc, file_size = info.CRC, info.file_size
+            else:
+                xml = self._render_part(member["parts"], values)
+                crc, file_size = zlib.crc32(xml), len(xml)
+                comp = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+                data = comp.compress(xml) + comp.flush()
+                compress_type = zipfile.ZIP_DEFLATED
+
+            name = info.filename.encode("utf-8")
+            flags = 0x800 if not info.filename.isascii() else 0
+            dostime = info.date_time[3] << 11 | info.date_time[4] << 5 | info.date_time[5] // 2
+            dosdate = (info.date_time[0] - 1980) << 9 | info.date_time[1] << 5 | info.date_time[2]
+            offset = out.tell()
+            out.write(_LOCAL_HEADER.pack(
+                b"PK\003\004", 20, 0, flags, compress_type, dostime, dosdate,
+                crc, len(data), file_size, len(name), 0,
+            ))
+            out.write(name)
+            out.write(data)
+            central.append(_CENTRAL_HEADER.pack(
+                b"PK\001\002", 20, 0, 20, 0, flags, compress_type, dostime, dosdate,
+                crc, len(data), file_size, len(name), 0, 0, 0, 0, info.external_attr, offset,
+            ) + name)
+
+        cd_offset = out.tell()
+        cd = b"".join(central)
+        out.write(cd)
+        out.write(_END_RECORD.pack(b"PK\005\006", 0, 0, len(central), len(central), len(cd), cd_offset, 0))
+        return out.getvalue()
+
+
 def replace_text_bytes(docx_bytes: bytes, placeholder: str, value: str) -> bytes:
     bio = io.BytesIO(docx_bytes)
     with zipfile.ZipFile(bio, "r") as zin:
@@ -1,10 +1,74 @@
+import hashlib
 import io
+import os
+import re
+import threading
 from docx import Document
+from docx.oxml.ns import qn
 from docx.shared import Cm
+from docx.text.paragraph import Paragraph
+
+# path -> {"stamp", "digest", "bytes"}: chỉ cache bytes của file (bỏ được lần đọc đĩa + sha256),
+# không cache Document — load_template parse lại từ bytes mỗi lần gọi (~15 ms với template.docx)
+_TEMPLATE_CACHE = {}
+_TEMPLATE_LOCK = threading.Lock()
+# (digest template, các key đã biết) -> manifest
+_MANIFEST_CACHE = {}
+
 
 def load_docx_bytes(docx_bytes: bytes):
     return Document(io.BytesIO(docx_bytes))
 
+
+def _template_entry(path):
+    path = os.path.abspath(os.fspath(path))
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _TEMPLATE_LOCK:
+        entry = _TEMPLATE_CACHE.get(path)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry
+
+    with open(path, "rb") as f:
+        docx_bytes = f.read()
+    digest = hashlib.sha256(docx_bytes).hexdigest()
+
+    with _TEMPLATE_LOCK:
+        entry = _TEMPLATE_CACHE.get(path)
+        if entry is not None and entry["digest"] == digest:
+            # file chỉ bị touch, nội dung không đổi
+            entry["stamp"] = stamp
+            return entry
+
+        entry = {
+            "stamp": stamp,
+            "digest": digest,
+            "bytes": docx_bytes,
+        }
+        _TEMPLATE_CACHE[path] = entry
+        return entry
+
+
+def load_template(path) -> Document:
+    """
+    Document mới parse từ bytes đã cache (file chỉ đọc + sha256 1 lần / mỗi phiên bản file).
+    Chi phí parse vẫn trả ở mỗi lần gọi; đổi lại các lần render (kể cả song song) không dùng chung
+    object nào của python-docx, không deepcopy Document (proxy cache sẽ lệch khỏi cây XML thật).
+    """
+    entry = _template_entry(path)
+    return load_docx_bytes(entry["bytes"])
+
+
+def template_digest(path) -> str:
+    return _template_entry(path)["digest"]
+
+
+def clear_template_cache():
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_CACHE.clear()
+        _MANIFEST_CACHE.clear()
+
 def save_docx(doc: Document) -> bytes:
     bio = io.BytesIO()
     doc.save(bio)
@@ -42,25 +106,140 @@ def _replace_in_paragraph(paragraph, placeholder, value):
     return True
 
 
-def replace_text(doc: Document, placeholder: str, value: str):
-    replaced = False
+_HEADER_FOOTER_ATTRS = (
+    "header", "first_page_header", "even_page_header",
+    "footer", "first_page_footer", "even_page_footer",
+)
 
-    # paragraphs
-    for p in doc.paragraphs:
-        if _replace_in_paragraph(p, placeholder, value):
-            replaced = True
 
-    # tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    if _replace_in_paragraph(p, placeholder, value):
-                        replaced = True
+class DocumentIndex:
+    """
+    Danh sách mọi paragraph của tài liệu đúng 1 lần: body, bảng lồng nhau, header, footer.
+    Ô gộp (merged cell) chỉ tính 1 lần. Xây 1 lần cho mỗi lần tạo biên bản,
+    replace_many / replace_text / insert_image dùng chung.
+
+    entries[i] = (location, paragraph); texts[i] = text nối các run của paragraph.
+    location: (tên phần, (bảng, dòng, cột), ...) vd. ("body", (3, 1, 0)).
+    """
 
+    def __init__(self, doc: Document):
+        self.entries = []
+        self.texts = []
+        self._walk(doc.element.body, doc._body, ("body",))
+
+        seen = set()
+        for section_no, section in enumerate(doc.sections):
+            for attr in _HEADER_FOOTER_ATTRS:
+                part = getattr(section, attr)
+                # linked_to_previous: dùng chung với section trước hoặc không có → bỏ qua, không tạo mới
+                if part.is_linked_to_previous or id(part._element) in seen:
+                    continue
+                seen.add(id(part._element))
+                self._walk(part._element, part, (attr, section_no))
+
+    def _walk(self, container, parent, location):
+        tables = 0
+        for child in container.iterchildren():
+            if child.tag == qn("w:p"):
+                self._add(location, Paragraph(child, parent))
+            elif child.tag == qn("w:tbl"):
+                for row_no, tr in enumerate(child.iterchildren(qn("w:tr"))):
+                    # w:tc chỉ xuất hiện 1 lần dù ô đó gộp ngang / dọc
+                    for col_no, tc in enumerate(tr.iterchildren(qn("w:tc"))):
+                        self._walk(tc, parent, location + ((tables, row_no, col_no),))
+                tables += 1
+            elif child.tag == qn("w:sdt"):
+                content = child.find(qn("w:sdtContent"))
+                if content is not None:
+                    self._walk(content, parent, location)
+
+    def _add(self, location, paragraph):
+        self.entries.append((location, paragraph))
+        self.texts.append("".join(r.text for r in paragraph.runs))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, needle: str):
+        """Vị trí các paragraph có chứa needle."""
+        return [i for i, text in enumerate(self.texts) if needle in text]
+
+    def paragraph(self, i):
+        return self.entries[i][1]
+
+    def refresh(self, i):
+        """Cập nhật lại text sau khi paragraph i bị sửa."""
+        self.texts[i] = "".join(r.text for r in self.entries[i][1].runs)
+
+
+def replace_text(doc: Document, placeholder: str, value: str, index: DocumentIndex = None):
+    index = index or DocumentIndex(doc)
+    replaced = False
+    for i in index.find(placeholder):
+        if _replace_in_paragraph(index.paragraph(i), placeholder, value):
+            index.refresh(i)
+            replaced = True
     return replaced
 
 
+def _compile_placeholders(keys):
+    # key dài trước để $ma_tram không bị $ma ăn mất
+    names = sorted({str(k) for k in keys}, key=len, reverse=True)
+    alt = "|".join(re.escape(n) for n in names)
+    # $key; và ${key}; giữ lại dấu ";" giống như gọi replace_text lần lượt
+    return re.compile(r"\$(?:\{(%s)\}|(%s))" % (alt, alt))
+
+
+def _replace_many_in_paragraph(paragraph, pattern, mapping, hits):
+    runs = paragraph.runs
+    if not runs:
+        return False
+
+    full_text = "".join(r.text for r in runs)
+    if "$" not in full_text:
+        return False
+
+    def _sub(m):
+        key = m.group(1) or m.group(2)
+        hits.add(key)
+        return mapping[key]
+
+    new_text = pattern.sub(_sub, full_text)
+    if new_text == full_text:
+        return False
+
+    # phân bổ lại như _replace_in_paragraph
+    pos = 0
+    for i, r in enumerate(runs):
+        if i == len(runs) - 1:
+            r.text = new_text[pos:]
+            break
+        take = len(r.text)
+        r.text = new_text[pos:pos + take]
+        pos += take
+
+    return True
+
+
+def replace_many(doc: Document, mapping: dict, index: DocumentIndex = None):
+    """
+    Thay tất cả placeholder $key, ${key}, $key;, ${key}; trong 1 lần duyệt.
+    Trả về set các key đã tìm thấy trong tài liệu.
+    """
+    hits = set()
+    mapping = {str(k): "" if v is None else str(v) for k, v in mapping.items()}
+    if not mapping:
+        return hits
+
+    index = index or DocumentIndex(doc)
+    pattern = _compile_placeholders(mapping)
+    for i in index.find("$"):
+        if _replace_many_in_paragraph(index.paragraph(i), pattern, mapping, hits):
+            index.refresh(i)
+
+    return hits
+
+
 def _insert_img_to_paragraph(paragraph, placeholder, img_bytes, width_cm):
     runs = paragraph.runs
     full_text = "".join(r.text for r in runs)
@@ -77,22 +256,13 @@ def _insert_img_to_paragraph(paragraph, placeholder, img_bytes, width_cm):
     return True
 
 
-def insert_image(doc: Document, placeholder: str, img_bytes: bytes, width_cm=12):
+def insert_image(doc: Document, placeholder: str, img_bytes: bytes, width_cm=12, index: DocumentIndex = None):
+    index = index or DocumentIndex(doc)
     inserted = False
-
-    # paragraphs
-    for p in doc.paragraphs:
-        if _insert_img_to_paragraph(p, placeholder, img_bytes, width_cm):
+    for i in index.find(placeholder):
+        if _insert_img_to_paragraph(index.paragraph(i), placeholder, img_bytes, width_cm):
+            index.refresh(i)
             inserted = True
-
-    # tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    if _insert_img_to_paragraph(p, placeholder, img_bytes, width_cm):
-                        inserted = True
-
     return inserted
 
 
@@ -154,3 +324,142 @@ def insert_image_in_final_table(doc: Document, image_no: int, title: str, img_by
 
     _add_image_to_cell(target_row.cells[1], img_bytes, width_cm)
     return True
+
+
+# ${Anh1}, $Anh1, ${anh1}, $anh1, Ảnh 1, ảnh 1, Anh 1, anh 1 (không ăn nhầm "anh 12" khi tìm ảnh 1)
+_IMAGE_PLACEHOLDER_RE = re.compile(r"\$\{[Aa]nh(\d+)\}|\$[Aa]nh(\d+)(?!\d)|(?:Ả|ả|A|a)nh (\d+)(?!\d)")
+
+
+def _find_image_table(doc: Document):
+    for table in reversed(doc.tables):
+        if not table.rows or len(table.columns) < 2:
+            continue
+        first_row = [cell.text.strip().lower() for cell in table.rows[0].cells[:2]]
+        if "hình" in first_row[1] or "hinh" in first_row[1]:
+            return table
+    return None
+
+
+def _image_row_map(table):
+    """Đọc bảng hình ảnh 1 lần: {tên hạng mục: vị trí dòng}, {số ảnh: vị trí dòng}."""
+    by_title, by_no = {}, {}
+    for pos, row in enumerate(table.rows[1:], start=1):
+        cells = row.cells
+        by_title.setdefault(cells[0].text.strip().lower(), pos)
+        for number in re.findall(r"\d+", cells[1].text):
+            by_no.setdefault(int(number), pos)
+    return by_title, by_no
+
+
+def insert_images(doc: Document, images: dict, width_cm=12, index: DocumentIndex = None, scan_placeholders=True):
+    """
+    Chèn tất cả ảnh trong 1 lần: images = {số ảnh: (tên hạng mục, bytes)}.
+    Ảnh có placeholder trong tài liệu thì chèn tại chỗ, còn lại đưa vào bảng hình ảnh cuối file
+    (tìm bảng và đọc các dòng 1 lần). Trả về {số ảnh: "placeholder" | "table"}.
+    scan_placeholders=False: template không có placeholder ảnh (theo manifest) → vào thẳng bảng.
+    """
+    placed = {}
+    if scan_placeholders:
+        index = index or DocumentIndex(doc)
+
+    for i, text in enumerate(index.texts if scan_placeholders else ()):
+        numbers = []
+        for m in _IMAGE_PLACEHOLDER_RE.finditer(text):
+            no = int(m.group(1) or m.group(2) or m.group(3))
+            if no in images:
+                numbers.append(no)
+        if not numbers:
+            continue
+        # nhiều ảnh cùng 1 paragraph: giống cách chèn lần lượt, ảnh đứng trước trong images được giữ
+        no = min(numbers, key=list(images).index)
+        paragraph = index.paragraph(i)
+        for r in paragraph.runs:
+            r.text = ""
+        paragraph.add_run().add_picture(io.BytesIO(images[no][1]), width=Cm(width_cm))
+        index.refresh(i)
+        placed[no] = "placeholder"
+
+    pending = [no for no in images if no not in placed]
+    if not pending:
+        return placed
+
+    table = _find_image_table(doc)
+    if table is None:
+        table = doc.add_table(rows=1, cols=2)
+        table.rows[0].cells[0].text = "TÊN HẠNG MỤC"
+        table.rows[0].cells[1].text = "HÌNH ẢNH"
+    rows = list(table.rows)
+    by_title, by_no = _image_row_map(table)
+
+    for no in pending:
+        title, img_bytes = images[no]
+        title_norm = title.strip().lower()
+        candidates = [p for p in (by_title.get(title_norm), by_no.get(no)) if p is not None]
+        if candidates:
+            row = rows[min(candidates)]
+        else:
+            row = table.add_row()
+            row.cells[0].text = title
+            rows.append(row)
+            by_title.setdefault(title_norm, len(rows) - 1)
+        _add_image_to_cell(row.cells[1], img_bytes, width_cm)
+        placed[no] = "table"
+
+    return placed
+
+
+# $tên / ${tên} bất kỳ, để báo placeholder template có mà code không biết
+_ANY_PLACEHOLDER_RE = re.compile(r"\$\{([A-Za-z_]\w*)\}|\$([A-Za-z_]\w*)")
+
+
+def _manifest_add(table, name, form, part):
+    item = table.setdefault(name, {"forms": set(), "parts": set(), "count": 0})
+    item["forms"].add(form)
+    item["parts"].add(part)
+    item["count"] += 1
+
+
+def build_manifest(doc: Document, keys):
+    """
+    Placeholder có trong tài liệu:
+    {"text": {key: {"forms", "parts", "count"}}, "images": {số ảnh: ...}, "unknown": {tên: ...}}
+    forms: cách viết trong file ($key, ${key}, Ảnh 3, ...); parts: body / header / footer / ...
+    """
+    keys = sorted({str(k) for k in keys})
+    pattern = _compile_placeholders(keys) if keys else None
+    manifest = {"text": {}, "images": {}, "unknown": {}}
+
+    index = DocumentIndex(doc)
+    for (location, _), text in zip(index.entries, index.texts):
+        part = location[0]
+        for m in _IMAGE_PLACEHOLDER_RE.finditer(text):
+            _manifest_add(manifest["images"], int(m.group(1) or m.group(2) or m.group(3)), m.group(0), part)
+        if "$" not in text:
+            continue
+        rest = text
+        if pattern is not None:
+            for m in pattern.finditer(text):
+                _manifest_add(manifest["text"], m.group(1) or m.group(2), m.group(0), part)
+            rest = pattern.sub("", text)
+        for m in _ANY_PLACEHOLDER_RE.finditer(_IMAGE_PLACEHOLDER_RE.sub("", rest)):
+            _manifest_add(manifest["unknown"], m.group(1) or m.group(2), m.group(0), part)
+
+    manifest["missing"] = [k for k in keys if k not in manifest["text"]]
+    return manifest
+
+
+def template_manifest(path, keys):
+    """
+    Manifest của template, tính 1 lần cho mỗi nội dung file (theo sha256) + bộ key.
+    Thêm "digest" để biết manifest thuộc phiên bản template nào.
+    """
+    entry = _template_entry(path)
+    cache_key = (entry["digest"], tuple(sorted({str(k) for k in keys})))
+    with _TEMPLATE_LOCK:
+        manifest = _MANIFEST_CACHE.get(cache_key)
+    if manifest is None:
+        # dựng trên bản Document riêng, không đụng tới cache template
+        manifest = {**build_manifest(load_docx_bytes(entry["bytes"]), keys), "digest": entry["digest"]}
+        with _TEMPLATE_LOCK:
+            _MANIFEST_CACHE[cache_key] = manifest
+    return manifest
@@ -0,0 +1,278 @@
+# modules/fakes.py
+"""
+Bản giả lập Drive / Docs / Sheets chạy offline (không cần mạng, không cần service account).
+Cùng cách gọi với googleapiclient (.files().get(...).execute(), batch HTTP, export_media)
+và gspread (worksheet().get_all_records()).
+Đếm số lần gọi để kiểm tra số round-trip tới Google.
+"""
+import itertools
+import re
+import threading
+
+_RANGE_RE = re.compile(r"^'?(.*?)'?!([A-Z]+|\d+):([A-Z]+|\d+)$")
+
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _trim(values):
+    values = list(values)
+    while values and values[-1] == "":
+        values.pop()
+    return values
+
+
+class _Call:
+    def __init__(self, fn, method_id=None):
+        self._fn = fn
+        # giống googleapiclient.http.HttpRequest.methodId, vd. "drive.files.get"
+        self.methodId = method_id
+
+    def execute(self, http=None):
+        return self._fn()
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, records):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.records = list(records)
+
+    def get_all_records(self):
+        self.spreadsheet.calls["get_all_records"] += 1
+        return [dict(r) for r in self.records]
+
+    def grid(self):
+        """Bảng giá trị dạng chuỗi như Sheets API trả về (FORMATTED_VALUE), dòng đầu là header."""
+        header = []
+        for r in self.records:
+            header.extend(k for k in r if k not in header)
+        rows = [[("" if r.get(h) is None else str(r.get(h, ""))) for h in header] for r in self.records]
+        return [header] + rows
+
+
+class FakeSpreadsheet:
+    """sheets: {tên worksheet: list[dict]}"""
+
+    def __init__(self, sheets, spreadsheet_id="fake-spreadsheet"):
+        self.id = spreadsheet_id
+        self.calls = {"worksheet": 0, "get_all_records": 0, "values_batch_get": 0}
+        self._sheets = {name: FakeWorksheet(self, name, rows) for name, rows in sheets.items()}
+
+    def worksheet(self, title):
+        self.calls["worksheet"] += 1
+        return self._sheets[title]
+
+    def values_batch_get(self, ranges, params=None):
+        """Hỗ trợ range dạng 'Sheet'!1:1 (dòng) và 'Sheet'!C:C (cột)."""
+        self.calls["values_batch_get"] += 1
+        by_columns = (params or {}).get("majorDimension") == "COLUMNS"
+        value_ranges = []
+        for a1 in ranges:
+            m = _RANGE_RE.match(a1)
+            grid = self._sheets[m.group(1)].grid()
+            if m.group(2).isdigit():
+                rows = grid[int(m.group(2)) - 1:int(m.group(3))]
+            else:
+                lo, hi = _col_index(m.group(2)), _col_index(m.group(3))
+                rows = [row[lo - 1:hi] for row in grid]
+            if by_columns:
+                width = max((len(r) for r in rows), default=0)
+                values = [_trim(r[i] if i < len(r) else "" for r in rows) for i in range(width)]
+            else:
+                values = [_trim(r) for r in rows]
+            while values and not values[-1]:
+                values.pop()
+            value_ranges.append({"range": a1, "values": values})
+        return {"valueRanges": value_ranges}
+
+    def set_records(self, title, records, drive=None):
+        """Sửa dữ liệu 1 worksheet, tăng version file trên FakeDrive (nếu có)."""
+        self._sheets[title].records = list(records)
+        if drive is not None:
+            drive.touch(self.id)
+
+
+class FakeApiError(Exception):
+    """Lỗi HTTP giả: có .response.status_code như gspread.APIError / requests.HTTPError."""
+
+    def __init__(self, status, reason=""):
+        super().__init__(f"HTTP {status} {reason}".strip())
+        self.response = type("Response", (), {"status_code": status, "text": reason})()
+
+
+class _FakeMediaRequest:
+    """Giống HttpRequest của export_media: MediaIoBaseDownload đọc .uri / .headers / .http."""
+
+    def __init__(self, uri, http):
+        self.uri = uri
+        self.headers = {}
+        self.http = http
+        self.methodId = "drive.files.export"
+
+
+class _FakeResponse(dict):
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class FakeHttp:
+    """Thay cho httplib2.Http khi tải file export (hỗ trợ header range như Drive)."""
+
+    def __init__(self, drive):
+        self._drive = drive
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        file_id = uri.rsplit("/", 2)[-2]
+        self._drive._hit("files.export", file_id)
+        data = self._drive.export_bytes(file_id)
+        m = re.match(r"bytes=(\d+)-(\d+)", (headers or {}).get("range", ""))
+        start, end = (int(m.group(1)), int(m.group(2))) if m else (0, len(data) - 1)
+        chunk = data[start:end + 1]
+        return _FakeResponse(206, {
+            "content-range": f"bytes {start}-{start + len(chunk) - 1}/{len(data)}",
+            "status": "206",
+        }), chunk
+
+
+class _FakeBatch:
+    def __init__(self, drive, callback):
+        self._drive = drive
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self, http=None):
+        self._drive._hit("batch", None)
+        for request_id, request in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except Exception as exc:
+                response, exception = None, exc
+            self._callback(request_id, response, exception)
+
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def get(self, fileId, fields=None, supportsAllDrives=False):
+        def run():
+            self._drive._hit("files.get", fileId)
+            return {"id": fileId, **self._drive.meta[fileId]}
+        return _Call(run, "drive.files.get")
+
+    def copy(self, fileId, body=None, supportsAllDrives=False):
+        def run():
+            drive = self._drive
+            drive._hit("files.copy", fileId)
+            with drive.lock:
+                new_id = f"copy-{next(drive._ids)}"
+            drive.add_file(new_id, name=(body or {}).get("name", ""), content=drive.meta[fileId].get("content", ""))
+            return {"id": new_id}
+        return _Call(run, "drive.files.copy")
+
+    def delete(self, fileId, supportsAllDrives=False):
+        def run():
+            drive = self._drive
+            drive._hit("files.delete", fileId)
+            with drive.lock:
+                if drive.meta.pop(fileId, None) is None:
+                    raise FakeApiError(404, "notFound")
+            return ""
+        return _Call(run, "drive.files.delete")
+
+    def export_media(self, fileId, mimeType=None):
+        return _FakeMediaRequest(f"fake://drive/files/{fileId}/export", FakeHttp(self._drive))
+
+
+class FakeDrive:
+    """
+    Drive giả: meta[file_id] = {"version", "modifiedTime", "name", "content", ...}.
+    fail(method, status, times) → `times` lần gọi tới method kế tiếp trả lỗi HTTP `status`.
+    """
+
+    def __init__(self):
+        self.meta = {}
+        self.calls = {
+            "files.get": 0, "files.copy": 0, "files.delete": 0, "files.export": 0,
+            "documents.batchUpdate": 0, "batch": 0,
+        }
+        self.lock = threading.Lock()
+        self._failures = {}
+        self._clock = itertools.count(1)
+        self._ids = itertools.count(1)
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def http(self):
+        return FakeHttp(self)
+
+    def add_file(self, file_id, **meta):
+        with self.lock:
+            self.meta[file_id] = {"version": "1", "modifiedTime": self._timestamp(), **meta}
+
+    def touch(self, file_id):
+        meta = self.meta[file_id]
+        meta["version"] = str(int(meta["version"]) + 1)
+        meta["modifiedTime"] = self._timestamp()
+
+    def fail(self, method, status, times=1):
+        with self.lock:
+            self._failures[method] = (status, times)
+
+    def export_bytes(self, file_id):
+        return str(self.meta[file_id].get("content", "")).encode("utf-8")
+
+    def _hit(self, method, file_id):
+        with self.lock:
+            self.calls[method] += 1
+            status, times = self._failures.get(method, (None, 0))
+            if times:
+                self._failures[method] = (status, times - 1)
+        if times:
+            raise FakeApiError(status, "rateLimitExceeded" if status == 403 else "")
+
+    def _timestamp(self):
+        return f"2026-01-01T00:00:{next(self._clock):02d}.000Z"
+
+
+class _FakeDocuments:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def batchUpdate(self, documentId, body):
+        def run():
+            drive = self._drive
+            drive._hit("documents.batchUpdate", documentId)
+            with drive.lock:
+                meta = drive.meta[documentId]
+                text = meta.get("content", "")
+                for req in body.get("requests", []):
+                    replace = req.get("replaceAllText")
+                    if replace:
+                        text = text.replace(replace["containsText"]["text"], replace["replaceText"])
+                meta["content"] = text
+            return {"documentId": documentId, "replies": []}
+        return _Call(run, "docs.documents.batchUpdate")
+
+
+class FakeDocs:
+    """Docs giả, dùng chung dữ liệu với FakeDrive (nội dung file là chuỗi text)."""
+
+    def __init__(self, drive):
+        self._drive = drive
+
+    def documents(self):
+        return _FakeDocuments(self._drive)
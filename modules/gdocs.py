@@ -1,58 +1,58 @@
 # modules/gdocs.py (PRO VERSION)
 import io
-import time
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
 import streamlit as st
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2 import service_account
+
+from modules import google_clients, retry
+from modules.google_clients import execute
 
 # === CONFIG ===
 TARGET_FOLDER_ID = "1r0NCx4cIDDQ6bfS2dQPfz2zio9VYN9FH"  # thư mục Drive của bạn
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# số biên bản copy / replace / export cùng lúc (token bucket trong modules/retry vẫn giữ quota)
+MAX_CONCURRENCY = 4
+# Google batch HTTP nhận tối đa 100 lệnh / request
+BATCH_SIZE = 100
+DELETE_ROUNDS = 3
 
-# Cache service để tăng tốc
-@st.cache_resource
+# Service dùng chung credentials + kết nối với gsheets (xem modules/google_clients.py)
 def get_service(service_name, version="v1"):
-    info = st.secrets["gcp_service_account"]
-    creds = service_account.Credentials.from_service_account_info(
-        info,
-        scopes=[
-            "https://www.googleapis.com/auth/documents",
-            "https://www.googleapis.com/auth/drive",
-        ],
-    )
-    return build(service_name, version, credentials=creds)
+    return google_clients.get_service(service_name, version)
 
 
 # === Retry wrapper (Google API hay lag) ===
+# execute() đã tự thử lại lỗi tạm thời (429 / 5xx / timeout) có backoff, xem modules/retry.py;
+# hàm này giữ cho code cũ gọi func bất kỳ
 def api_retry(func, max_attempts=4, wait=0.6):
-    for attempt in range(max_attempts):
-        try:
-            return func()
-        except Exception as e:
-            if attempt == max_attempts - 1:
-                raise e
-            time.sleep(wait)
+    return retry.RetryPolicy(max_attempts=max_attempts, base=wait).call(func, api="gdocs")
 
 
-# === MAIN FUNCTION: COPY + REPLACE ===
-def copy_template_and_replace(template_doc_id: str, user_data: dict, title: str):
+# files.copy không idempotent: timeout / 5xx có thể đã tạo bản copy rồi → thử lại sẽ ra 2 file.
+# Chỉ thử lại khi Google từ chối trước khi làm gì (429 / hết quota theo phút).
+_COPY_POLICY = retry.RetryPolicy(retryable=frozenset({"http_429", "rate_limit"}))
 
-    drive = get_service("drive", "v3")
-    docs = get_service("docs", "v1")
 
-    # === STEP 1: COPY TEMPLATE VÀO FOLDER CỦA BẠN ===
-    copied = api_retry(lambda: drive.files().copy(
+def _copy_template(drive, template_doc_id, title, http=None):
+    copied = execute(drive.files().copy(
         fileId=template_doc_id,
         body={
             "name": title,
             "parents": [TARGET_FOLDER_ID]
         },
         supportsAllDrives=True
-    ).execute())
+    ), policy=_COPY_POLICY, http=http)
+    return copied.get("id")
 
-    new_id = copied.get("id")
 
-    # ==== STEP 2: TÍNH TOÁN TRƯỜNG PHỤ ====
+def _replace_placeholders(docs, doc_id, user_data, http=None):
+    # ==== TÍNH TOÁN TRƯỜNG PHỤ ====
     user_data["Danh_gia_cot"] = (
         "Đạt" if user_data.get("Loai_cot") == "cột dây co" else "Không đánh giá"
     )
@@ -63,7 +63,7 @@ def copy_template_and_replace(template_doc_id: str, user_data: dict, title: str)
         "Đạt" if user_data.get("Dieu_hoa") != "Không thuê" else "Không đánh giá"
     )
 
-    # ==== STEP 3: BATCH REPLACE PLACEHOLDERS ====
+    # ==== BATCH REPLACE PLACEHOLDERS ====
     requests = [
         {
             "replaceAllText": {
@@ -74,33 +74,69 @@ def copy_template_and_replace(template_doc_id: str, user_data: dict, title: str)
         for k, v in user_data.items()
     ]
 
-    api_retry(lambda: docs.documents().batchUpdate(
-        documentId=new_id,
+    execute(docs.documents().batchUpdate(
+        documentId=doc_id,
         body={"requests": requests}
-    ).execute())
+    ), http=http)
+
+
+# === MAIN FUNCTION: COPY + REPLACE ===
+def copy_template_and_replace(template_doc_id: str, user_data: dict, title: str, drive=None, docs=None):
+
+    drive = drive or get_service("drive", "v3")
+    docs = docs or get_service("docs", "v1")
+
+    # === STEP 1: COPY TEMPLATE VÀO FOLDER CỦA BẠN ===
+    new_id = _copy_template(drive, template_doc_id, title)
+
+    # ==== STEP 2 + 3: TRƯỜNG PHỤ + BATCH REPLACE ====
+    _replace_placeholders(docs, new_id, user_data)
 
     return new_id
 
 
+def _download(drive, doc_id, fh, http=None):
+    request = drive.files().export_media(fileId=doc_id, mimeType=DOCX_MIME)
+    with (nullcontext(http) if http is not None else google_clients.pooled_http()) as conn:
+        request.http = conn
+        downloader = MediaIoBaseDownload(fh, request)
+
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+
+
 # === EXPORT DOCX — TỐI ƯU TẢI FILE ===
-def export_docx_and_download(doc_id: str, suggested_filename: str):
+def export_docx_and_download(doc_id: str, suggested_filename: str, drive=None, http=None):
 
-    drive = get_service("drive", "v3")
+    drive = drive or get_service("drive", "v3")
+
+    def download():
+        # lỗi giữa chừng → thử lại từ đầu với buffer mới
+        fh = io.BytesIO()
+        _download(drive, doc_id, fh, http)
+        return fh.getvalue()
+
+    return google_clients.call("drive", "files.export", download)
 
-    request = drive.files().export_media(
-        fileId=doc_id,
-        mimeType="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    )
 
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+def export_docx_to_file(doc_id: str, path, drive=None, http=None):
+    """Ghi thẳng ra đĩa theo từng chunk (không giữ cả file trong RAM); lỗi thì không để lại file dở."""
+    drive = drive or get_service("drive", "v3")
+    path = Path(path)
+    part = path.with_name(path.name + ".part")
 
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
+    def download():
+        try:
+            with open(part, "wb") as fh:
+                _download(drive, doc_id, fh, http)
+            os.replace(part, path)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        return path
 
-    fh.seek(0)
-    return fh.read()
+    return google_clients.call("drive", "files.export", download)
 
 
 # === AUTO DELETE TEMP FILE ON DRIVE ===
@@ -109,6 +145,113 @@ def delete_drive_file(file_id: str):
     drive = get_service("drive", "v3")
 
     try:
-        api_retry(lambda: drive.files().delete(fileId=file_id).execute())
+        execute(drive.files().delete(fileId=file_id))
     except Exception as e:
         st.warning(f"Không thể xóa file tạm: {e}")
+
+
+def delete_drive_files(file_ids, drive=None, http=None):
+    """
+    Xoá nhiều file bằng Google batch HTTP (tối đa BATCH_SIZE lệnh / request).
+    Lỗi tạm thời (429 / 5xx) thử lại ở vòng sau. Trả về {file_id: lỗi} các file không xoá được.
+    """
+    drive = drive or get_service("drive", "v3")
+    pending = list(dict.fromkeys(file_ids))
+    failed = {}
+
+    for round_no in range(1, DELETE_ROUNDS + 1):
+        if not pending:
+            break
+        errors = {}
+
+        def on_done(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+
+        for start in range(0, len(pending), BATCH_SIZE):
+            chunk = pending[start:start + BATCH_SIZE]
+            batch = drive.new_batch_http_request(callback=on_done)
+            for file_id in chunk:
+                # quota tính theo từng lệnh trong batch
+                retry.throttle("drive")
+                batch.add(drive.files().delete(fileId=file_id, supportsAllDrives=True), request_id=file_id)
+            try:
+                with (nullcontext(http) if http is not None else google_clients.pooled_http()) as conn:
+                    with google_clients.track("drive", "batch.delete"):
+                        batch.execute(http=conn)
+            except Exception as exc:
+                errors.update({file_id: exc for file_id in chunk})
+
+        # file đã không còn (404) coi như xoá xong
+        errors = {k: e for k, e in errors.items() if retry.error_class(e) != "http_404"}
+        pending = [k for k, e in errors.items() if retry.is_retryable(e)]
+        failed = errors
+        if pending and round_no < DELETE_ROUNDS:
+            retry.DEFAULT_POLICY.pause(round_no)
+
+    return failed
+
+
+def _safe_name(value):
+    return re.sub(r"[^\w.-]+", "-", str(value)).strip("-") or "document"
+
+
+def _unique_paths(out_dir, titles):
+    """Tên file theo title; trùng tên (kể cả sau _safe_name) thì thêm -2, -3, ..."""
+    used = set()
+    paths = []
+    for title in titles:
+        base = _safe_name(title)
+        name, n = base, 1
+        while name.lower() in used:
+            n += 1
+            name = f"{base}-{n}"
+        used.add(name.lower())
+        paths.append(out_dir / f"{name}.docx")
+    return paths
+
+
+def export_many(jobs, out_dir, max_workers=MAX_CONCURRENCY, drive=None, docs=None, http=None):
+    """
+    Tạo nhiều biên bản qua Google Docs cùng lúc.
+    jobs: [(template_doc_id, user_data, title)]. Mỗi job: copy → batchUpdate → export ra out_dir/<title>.docx
+    (title trùng nhau thì <title>-2.docx, ...),
+    tối đa max_workers job chạy song song. Cuối cùng xoá toàn bộ file tạm trên Drive bằng batch,
+    kể cả khi có job lỗi.
+    Trả về list theo thứ tự jobs: {"title", "path", "doc_id", "error"}.
+    """
+    drive = drive or get_service("drive", "v3")
+    docs = docs or get_service("docs", "v1")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    created = []
+    created_lock = threading.Lock()
+
+    jobs = list(jobs)
+    paths = _unique_paths(out_dir, [title for _, _, title in jobs])
+
+    def run(job, path):
+        template_doc_id, user_data, title = job
+        result = {"title": title, "path": None, "doc_id": None, "error": None}
+        try:
+            doc_id = _copy_template(drive, template_doc_id, title, http)
+            result["doc_id"] = doc_id
+            with created_lock:
+                created.append(doc_id)
+            _replace_placeholders(docs, doc_id, dict(user_data), http)
+            result["path"] = str(export_docx_to_file(doc_id, path, drive, http))
+        except Exception as exc:
+            result["error"] = exc
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gdocs-export") as pool:
+            results = list(pool.map(run, jobs, paths))
+    finally:
+        if created:
+            failed = delete_drive_files(created, drive, http)
+            if failed:
+                st.warning(f"Không thể xóa {len(failed)} file tạm trên Drive: {', '.join(failed)}")
+
+    return results
@@ -0,0 +1,178 @@
+# modules/google_clients.py
+"""
+Client Google dùng chung cho gsheets và gdocs trong 1 process:
+- 1 bộ credentials (token được refresh và dùng lại giữa Sheets / Drive / Docs)
+- 1 requests session keep-alive cho gspread
+- service googleapiclient build từ discovery document có sẵn trong package (không tải qua mạng)
+- pool httplib2 keep-alive cho các lệnh .execute() của googleapiclient
+- mọi lệnh gọi đi qua call(): giới hạn tốc độ + thử lại có backoff (modules/retry.py)
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import gspread
+import httplib2
+import streamlit as st
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+
+from modules import metrics, retry
+from modules.retry import error_class
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/documents",
+]
+HTTP_TIMEOUT = 60
+POOL_SIZE = 16
+
+_LOCK = threading.RLock()
+_CACHE = {}
+# httplib2.Http không thread-safe → mỗi lệnh mượn 1 cái từ pool rồi trả lại
+_HTTP_POOL = queue.LifoQueue()
+
+API_CALLS = metrics.counter(
+    "bbnt_google_api_requests_total", "Số lệnh gọi Google API theo kết quả", ["api", "method", "outcome"],
+)
+API_LATENCY = metrics.histogram(
+    "bbnt_google_api_latency_seconds", "Thời gian 1 lệnh gọi Google API", ["api", "method"],
+)
+API_ERRORS = metrics.counter(
+    "bbnt_google_api_errors_total", "Lỗi Google API theo loại", ["api", "error_class"],
+)
+
+
+def get_gcp_config():
+    try:
+        return st.secrets["gcp_service_account"]
+    except Exception as exc:
+        raise RuntimeError(
+            "Thiếu cấu hình Google Sheets. Hãy tạo file .streamlit/secrets.toml "
+            "với block [gcp_service_account] và SPREADSHEET_URL."
+        ) from exc
+
+
+def _cached(key, factory):
+    with _LOCK:
+        if key in _CACHE:
+            return _CACHE[key]
+    # tạo ngoài lock: factory có thể gọi mạng (open_by_url, build) → các key khác không phải chờ;
+    # 2 thread cùng tạo 1 key thì giữ bản vào trước
+    value = factory()
+    with _LOCK:
+        return _CACHE.setdefault(key, value)
+
+
+def get_credentials():
+    return _cached("credentials", lambda: service_account.Credentials.from_service_account_info(
+        get_gcp_config(),
+        scopes=SCOPES,
+    ))
+
+
+def get_session():
+    def make():
+        session = AuthorizedSession(get_credentials())
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        return session
+    return _cached("session", make)
+
+
+def get_gspread_client():
+    return _cached("gspread", lambda: gspread.Client(auth=get_credentials(), session=get_session()))
+
+
+def get_spreadsheet(spreadsheet_url):
+    # metadata spreadsheet chỉ cần lấy 1 lần, các lần đọc sau dùng lại
+    return _cached(("spreadsheet", spreadsheet_url), lambda: call(
+        "sheets", "spreadsheets.get", lambda: get_gspread_client().open_by_url(spreadsheet_url),
+    ))
+
+
+def get_service(service_name, version="v1"):
+    return _cached(("service", service_name, version), lambda: build(
+        service_name,
+        version,
+        credentials=get_credentials(),
+        static_discovery=True,
+        cache_discovery=False,
+    ))
+
+
+@contextmanager
+def pooled_http():
+    try:
+        http = _HTTP_POOL.get_nowait()
+    except queue.Empty:
+        http = AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    try:
+        yield http
+    finally:
+        if _HTTP_POOL.qsize() < POOL_SIZE:
+            _HTTP_POOL.put(http)
+
+
+@contextmanager
+def track(api, method):
+    """Đo thời gian + đếm kết quả 1 lệnh gọi Google (dùng cho cả gspread lẫn googleapiclient)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        API_CALLS.inc(api=api, method=method, outcome="error")
+        API_ERRORS.inc(api=api, error_class=error_class(exc))
+        raise
+    else:
+        API_CALLS.inc(api=api, method=method, outcome="ok")
+    finally:
+        API_LATENCY.observe(time.perf_counter() - started, api=api, method=method)
+
+
+def _method_of(request):
+    # HttpRequest.methodId dạng "drive.files.get"
+    api, _, method = (getattr(request, "methodId", None) or "unknown.unknown").partition(".")
+    return api, method
+
+
+def call(api, method, func, policy=None):
+    """
+    Gọi func() (1 lệnh tới Google) qua token bucket của api, thử lại lỗi tạm thời theo policy.
+    Mỗi lần thử được đo / đếm riêng (track).
+    """
+    def attempt():
+        retry.throttle(api)
+        with track(api, method):
+            return func()
+    return (policy or retry.DEFAULT_POLICY).call(attempt, api=api)
+
+
+def execute(request, policy=None, http=None):
+    """
+    request.execute() qua 1 kết nối keep-alive trong pool, có giới hạn tốc độ + thử lại.
+    http: dùng kết nối này thay cho pool (vd. FakeHttp khi chạy offline).
+    """
+    def run():
+        if http is not None:
+            return request.execute(http=http)
+        with pooled_http() as conn:
+            return request.execute(http=conn)
+    api, method = _method_of(request)
+    return call(api, method, run, policy)
+
+
+def clear():
+    """Bỏ toàn bộ client đã cache (vd. sau khi đổi secrets.toml)."""
+    with _LOCK:
+        _CACHE.clear()
+    while True:
+        try:
+            _HTTP_POOL.get_nowait()
+        except queue.Empty:
+            break
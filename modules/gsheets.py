@@ -1,51 +1,198 @@
-import gspread
-import pandas as pd
-import streamlit as st
-from google.oauth2 import service_account
+import re
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-    "https://www.googleapis.com/auth/documents",
-]
+import pandas as pd
+from gspread.utils import numericise
 
-
-def get_gcp_config():
-    try:
-        return st.secrets["gcp_service_account"]
-    except Exception as exc:
-        raise RuntimeError(
-            "Thiếu cấu hình Google Sheets. Hãy tạo file .streamlit/secrets.toml "
-            "với block [gcp_service_account] và SPREADSHEET_URL."
-        ) from exc
+from modules import google_clients, retry, timing
+from modules.google_clients import get_gcp_config
+# trước đây SCOPES khai báo ở đây; giữ tên cũ cho code ngoài còn import gsheets.SCOPES
+from modules.google_clients import SCOPES  # noqa: F401
 
 
 def get_creds_from_secrets():
-    gcp = get_gcp_config()
-    creds = service_account.Credentials.from_service_account_info(
-        gcp,
-        scopes=SCOPES
-    )
-    return creds
+    return google_clients.get_credentials()
 
 def open_spreadsheet():
     gcp = get_gcp_config()
     spreadsheet_url = gcp["SPREADSHEET_URL"]
-    creds = get_creds_from_secrets()
-    client = gspread.authorize(creds)
-    sh = client.open_by_url(spreadsheet_url)
-    return sh
+    return google_clients.get_spreadsheet(spreadsheet_url)
+
+def spreadsheet_id_from_url(url: str) -> str:
+    m = re.search(r"/spreadsheets/d/([a-zA-Z0-9-_]+)", url)
+    if not m:
+        raise ValueError(f"SPREADSHEET_URL không hợp lệ: {url}")
+    return m.group(1)
+
+
+# kiểm tra version chỉ để tiết kiệm 1 lần tải; lỗi thì tải luôn, không đáng chờ lâu
+_VERSION_POLICY = retry.RetryPolicy(max_attempts=2, deadline=5.0)
+
+
+@timing.timed("drive.files_get")
+def get_spreadsheet_version(drive, spreadsheet_id: str, http=None) -> str:
+    """Version Drive của file: đổi mỗi khi nội dung sheet thay đổi, gọi rất rẻ."""
+    meta = google_clients.execute(drive.files().get(
+        fileId=spreadsheet_id,
+        fields="version,modifiedTime",
+        supportsAllDrives=True,
+    ), policy=_VERSION_POLICY, http=http)
+    return f"{meta.get('version')}:{meta.get('modifiedTime')}"
+
+
+# {(spreadsheet_id, tên sheet): [(số thứ tự cột, tên cột)]} — vị trí các cột cần đọc,
+# lưu kèm snapshot (modules/datastore) để process mới không phải đọc cả vùng COLD_RANGE
+_COLUMN_LAYOUT = {}
+# vùng đọc khi chưa biết vị trí cột (702 cột đầu)
+COLD_RANGE = "A:ZZ"
+
+
+def column_layout(spreadsheet_id):
+    """{tên sheet: [[số thứ tự cột, tên cột]]} đã biết của spreadsheet, để lưu kèm snapshot."""
+    return {name: [list(col) for col in layout]
+            for (sid, name), layout in list(_COLUMN_LAYOUT.items()) if sid == spreadsheet_id}
+
+
+def seed_column_layout(spreadsheet_id, layouts):
+    """Nạp vị trí cột từ snapshot lúc khởi động; sheet đã có vị trí trong process thì giữ nguyên."""
+    for name, layout in (layouts or {}).items():
+        _COLUMN_LAYOUT.setdefault((spreadsheet_id, name), [(int(i), str(col)) for i, col in layout])
+
+
+def _normalize_header(value):
+    return str(value).lower().replace("_", "").replace(" ", "")
+
 
-def load_dataframes():
-    sh = open_spreadsheet()
+def _col_letter(n: int) -> str:
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
 
-    sheet_csdl = sh.worksheet("CSDL")
-    sheet_taichinh = sh.worksheet("Taichinh")
 
-    df_csdl = pd.DataFrame(sheet_csdl.get_all_records())
-    df_taichinh = pd.DataFrame(sheet_taichinh.get_all_records())
+def _layout_from_header(header, fields):
+    wanted = {_normalize_header(f) for f in fields}
+    layout = []
+    seen = set()
+    for i, col in enumerate(header, start=1):
+        col = str(col).strip()
+        if _normalize_header(col) in wanted and col not in seen:
+            seen.add(col)
+            layout.append((i, col))
+    return layout
+
+
+def _frame(columns):
+    n_rows = max((len(v) for v in columns.values()), default=0)
+    data = {
+        # ô trống cuối cột bị API cắt bớt; numericise giống get_all_records
+        header: pd.Series(
+            [numericise(v) for v in values] + [""] * (n_rows - len(values)),
+            dtype=object,
+        )
+        for header, values in columns.items()
+    }
+    return pd.DataFrame(data, columns=list(columns))
+
+
+def _read_columns(sh, sheet_names, fields):
+    """
+    1 lần values:batchGet cho mọi sheet. Sheet đã biết vị trí cột: dòng header + các cột cần;
+    chưa biết (lần đầu trong process): cả vùng COLD_RANGE, lấy header ngay trong cùng response.
+    Trả về None (và cập nhật vị trí cột) nếu header đã khác lần trước.
+    """
+    layouts = [_COLUMN_LAYOUT.get((sh.id, name)) for name in sheet_names]
+    ranges = []
+    for name, layout in zip(sheet_names, layouts):
+        if layout is None:
+            ranges.append(f"'{name}'!{COLD_RANGE}")
+            continue
+        ranges.append(f"'{name}'!1:1")
+        ranges.extend(f"'{name}'!{_col_letter(i)}:{_col_letter(i)}" for i, _ in layout)
+    with timing.stage("sheets.batch_get", ranges=len(ranges)):
+        resp = google_clients.call(
+            "sheets", "values.batchGet",
+            lambda: sh.values_batch_get(ranges, params={"majorDimension": "COLUMNS"}),
+        )
+    value_ranges = iter(resp.get("valueRanges", []))
+
+    stale = False
+    frames = []
+    for name, layout in zip(sheet_names, layouts):
+        # đọc theo cột: [[h1, ...], [h2, ...], ...]
+        head = next(value_ranges, {}).get("values", [])
+        header = [col[0] if col else "" for col in head]
+        current = _layout_from_header(header, fields)
+        if layout is None:
+            _COLUMN_LAYOUT[(sh.id, name)] = current
+            frames.append(_frame({h: (head[i - 1] if i <= len(head) else [])[1:] for i, h in current}))
+            continue
+
+        fetched = [next(value_ranges, {}) for _ in layout]
+        if current != layout:
+            _COLUMN_LAYOUT[(sh.id, name)] = current
+            stale = True
+            continue
+        frames.append(_frame({
+            h: (vr.get("values") or [[]])[0][1:] for (_, h), vr in zip(layout, fetched)
+        }))
+    if stale:
+        return None
+    return frames
+
+
+def load_dataframes_projected(fields, sh=None, sheet_names=("CSDL", "Taichinh")):
+    """
+    Chỉ đọc các cột có tên (so theo normalize) nằm trong `fields`, gộp trong 1 lần values:batchGet.
+    Vị trí cột được nhớ lại (lần đầu lấy luôn từ cùng response);
+    header thay đổi so với lần trước thì đọc lại thêm 1 lần theo vị trí mới.
+    """
+    sh = sh or open_spreadsheet()
+    sheet_names = list(sheet_names)
+
+    frames = _read_columns(sh, sheet_names, fields)
+    if frames is None:
+        frames = _read_columns(sh, sheet_names, fields)
+        if frames is None:
+            raise RuntimeError("Header Google Sheet thay đổi trong lúc đang đọc, thử lại sau.")
+
+    return (*frames, sh)
+
+
+def load_dataframes(sh=None, fields=None):
+    if fields is not None:
+        return load_dataframes_projected(fields, sh)
+
+    sh = sh or open_spreadsheet()
+
+    with timing.stage("sheets.get_all_records", sheets=2):
+        sheet_csdl = google_clients.call("sheets", "spreadsheets.get", lambda: sh.worksheet("CSDL"))
+        sheet_taichinh = google_clients.call("sheets", "spreadsheets.get", lambda: sh.worksheet("Taichinh"))
+        df_csdl = pd.DataFrame(google_clients.call("sheets", "values.get", sheet_csdl.get_all_records))
+        df_taichinh = pd.DataFrame(google_clients.call("sheets", "values.get", sheet_taichinh.get_all_records))
 
     df_csdl.columns = [c.strip() for c in df_csdl.columns]
     df_taichinh.columns = [c.strip() for c in df_taichinh.columns]
 
     return df_csdl, df_taichinh, sh
+
+
+def load_dataframes_if_changed(known_version=None, drive=None, sh=None, spreadsheet_id=None, fields=None, http=None):
+    """
+    Kiểm tra version trên Drive trước, chỉ tải toàn bộ khi sheet đã thay đổi.
+    Trả về (None, version) nếu không đổi, ngược lại ((df_csdl, df_taichinh, sh), version).
+    version = None khi không đọc được Drive (khi đó luôn tải toàn bộ).
+    http: kết nối dùng cho lệnh gọi Drive thay cho pool (vd. FakeDrive.http() khi chạy offline).
+    """
+    try:
+        if drive is None:
+            drive = google_clients.get_service("drive", "v3")
+        if spreadsheet_id is None:
+            spreadsheet_id = spreadsheet_id_from_url(get_gcp_config()["SPREADSHEET_URL"])
+        version = get_spreadsheet_version(drive, spreadsheet_id, http)
+    except Exception:
+        version = None
+
+    if version is not None and version == known_version:
+        return None, version
+    return load_dataframes(sh, fields), version
@@ -0,0 +1,291 @@
+# modules/image_store.py
+"""
+Kho ảnh dùng chung cả process, đánh địa chỉ theo sha256 nội dung.
+
+Session chỉ giữ 1 record nhỏ cho mỗi ảnh: {"digest", "size", "preview", "preview_base", "rotation"}.
+"preview" là bản WebP/JPEG rộng tối đa PREVIEW_WIDTH để hiển thị trên trang; bytes đầy đủ chỉ dùng khi chèn DOCX.
+Bytes JPEG đầy đủ nằm trong BlobStore: giữ trong RAM tới ngưỡng MEMORY_BUDGET,
+vượt ngưỡng thì đẩy ảnh ít dùng nhất (LRU) ra thư mục tạm, cần lại thì đọc từ đĩa.
+Thư mục tạm cũng có ngưỡng (DISK_BUDGET): vượt thì xoá file ít dùng nhất; record trỏ tới ảnh đã bị xoá
+thì get_bytes báo KeyError (người dùng upload lại).
+
+Xoay ảnh chỉ ghi lại góc xoay trong record (không đụng tới JPEG gốc);
+góc xoay được áp 1 lần khi lấy bytes để chèn DOCX (get_bytes), kết quả được nhớ lại.
+"""
+import atexit
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+MEMORY_BUDGET = 256 * 1024 * 1024
+DISK_BUDGET = 2 * 1024 * 1024 * 1024
+PREVIEW_WIDTH = 450
+# WebP nhỏ hơn JPEG ~25-35% ở cùng chất lượng; Pillow build không có libwebp thì dùng JPEG
+PREVIEW_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+PREVIEW_QUALITY = 75
+PREVIEW_CACHE_SIZE = 512
+ROTATED_CACHE_SIZE = 512
+# ngân sách mặc định cho mỗi ảnh chèn vào biên bản
+MAX_SIDE = 1600
+JPEG_QUALITY = 85
+MAX_BYTES = 700 * 1024
+MIN_QUALITY = 55
+_EXIF_ORIENTATION = 0x0112
+
+
+class BlobStore:
+    def __init__(self, budget=MEMORY_BUDGET, spill_dir=None, disk_budget=DISK_BUDGET):
+        self.budget = budget
+        self.disk_budget = disk_budget
+        self._spill_dir = spill_dir
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        # digest -> số byte của file đã ghi ra thư mục tạm, thứ tự LRU
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="bbnt-images-")
+            atexit.register(shutil.rmtree, self._spill_dir, True)
+        return os.path.join(self._spill_dir, digest)
+
+    def _remember(self, digest, data):
+        # gọi khi đang giữ _lock
+        if digest in self._mem:
+            self._mem.move_to_end(digest)
+            return
+        self._mem[digest] = data
+        self._mem_bytes += len(data)
+        while self._mem_bytes > self.budget and len(self._mem) > 1:
+            old_digest, old_data = self._mem.popitem(last=False)
+            self._mem_bytes -= len(old_data)
+            self._spill(old_digest, old_data)
+
+    def _spill(self, digest, data):
+        # gọi khi đang giữ _lock
+        if digest in self._disk:
+            self._disk.move_to_end(digest)
+            return
+        path = self._path(digest)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._disk[digest] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.disk_budget and len(self._disk) > 1:
+            old_digest, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.unlink(self._path(old_digest))
+            except FileNotFoundError:
+                pass
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._remember(digest, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with self._lock:
+            data = self._mem.get(digest)
+            if data is not None:
+                self._mem.move_to_end(digest)
+                return data
+            if digest in self._disk:
+                self._disk.move_to_end(digest)
+        try:
+            with open(self._path(digest), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise KeyError(digest) from None
+        with self._lock:
+            self._remember(digest, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._mem), "bytes": self._mem_bytes, "budget": self.budget,
+                "disk_items": len(self._disk), "disk_bytes": self._disk_bytes, "disk_budget": self.disk_budget,
+            }
+
+
+_STORE = BlobStore()
+# (digest gốc, góc xoay) -> digest ảnh đã xoay, LRU tối đa ROTATED_CACHE_SIZE
+_ROTATED = OrderedDict()
+_ROTATED_LOCK = threading.Lock()
+# (digest gốc, góc xoay) -> bytes preview; dùng chung cho mọi session trong process
+_PREVIEWS = OrderedDict()
+_PREVIEWS_LOCK = threading.Lock()
+_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+
+def bytes_from_pil(img: Image.Image, quality=JPEG_QUALITY):
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _encode_preview(img: Image.Image):
+    buf = io.BytesIO()
+    img.save(buf, format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def _preview_bytes(img: Image.Image):
+    preview = img.copy()
+    preview.thumbnail((PREVIEW_WIDTH, PREVIEW_WIDTH * 4))
+    return _encode_preview(preview)
+
+
+def _cached_preview(key, make):
+    with _PREVIEWS_LOCK:
+        data = _PREVIEWS.get(key)
+        if data is not None:
+            _PREVIEWS.move_to_end(key)
+            return data
+    data = make()
+    with _PREVIEWS_LOCK:
+        _PREVIEWS[key] = data
+        while len(_PREVIEWS) > PREVIEW_CACHE_SIZE:
+            _PREVIEWS.popitem(last=False)
+    return data
+
+
+def _encode_within(img: Image.Image, quality, max_bytes):
+    data = bytes_from_pil(img, quality)
+    while max_bytes and len(data) > max_bytes and quality > MIN_QUALITY:
+        quality = max(MIN_QUALITY, quality - 10)
+        data = bytes_from_pil(img, quality)
+    return data
+
+
+def _can_passthrough(img: Image.Image, data: bytes, max_side, max_bytes):
+    return (
+        img.format == "JPEG"
+        and img.mode in ("RGB", "L")
+        and max(img.size) <= max_side
+        and (not max_bytes or len(data) <= max_bytes)
+        and img.getexif().get(_EXIF_ORIENTATION, 1) == 1
+    )
+
+
+def ingest(data: bytes, max_side=MAX_SIDE, quality=JPEG_QUALITY, max_bytes=MAX_BYTES):
+    """
+    Nhận ảnh upload, trả về record.
+    - JPEG đã đủ nhỏ, không xoay EXIF: giữ nguyên bytes, không encode lại.
+    - JPEG lớn: decode ở chế độ draft (giảm 1/2, 1/4, 1/8 ngay trong bộ giải mã) rồi mới resize.
+    - Áp EXIF orientation 1 lần; encode trong giới hạn max_side / max_bytes.
+    """
+    img = Image.open(io.BytesIO(data))
+    if _can_passthrough(img, data, max_side, max_bytes):
+        size = img.size
+        # chỉ cần decode đủ để làm preview
+        scale = min(1.0, PREVIEW_WIDTH / max(img.size))
+        img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+        return _make_record(data, size, img)
+
+    if img.format == "JPEG":
+        # draft chọn tỉ lệ giảm lớn nhất mà ảnh vẫn >= kích thước yêu cầu ở cả 2 chiều
+        scale = min(1.0, max_side / max(img.size))
+        img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side))
+    return _make_record(_encode_within(img, quality, max_bytes), img.size, img)
+
+
+def ingest_many(items, max_workers=None, **budget):
+    """
+    Xử lý nhiều ảnh song song (Pillow nhả GIL khi decode / resize / encode).
+    items: list bytes. Trả về list (record, lỗi) theo đúng thứ tự đầu vào.
+    """
+    def one(data):
+        try:
+            return ingest(data, **budget), None
+        except Exception as exc:
+            return None, exc
+
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-ingest") as pool:
+        return list(pool.map(one, items))
+
+
+def _make_record(data, size, img):
+    digest = _STORE.put(data)
+    # cùng ảnh upload lại (session khác, upload lại sau khi xoá) thì không phải làm preview lần nữa
+    preview = _cached_preview((digest, 0), lambda: _preview_bytes(img))
+    return {
+        "digest": digest,
+        "size": size,
+        "preview": preview,
+        "preview_base": preview,
+        "rotation": 0,
+    }
+
+
+def rotate(record, angle):
+    """
+    Xoay ngược chiều kim đồng hồ `angle` độ (bội của 90).
+    Chỉ xoay preview nhỏ, ảnh gốc giữ nguyên tới lúc get_bytes.
+    """
+    rotation = (record.get("rotation", 0) + angle) % 360
+    width, height = record["size"]
+    if angle % 180:
+        width, height = height, width
+
+    # xoay từ preview gốc để không mất chất lượng dần theo số lần bấm
+    preview = record["preview_base"]
+    if rotation:
+        preview = _cached_preview(
+            (record["digest"], rotation),
+            lambda: _encode_preview(Image.open(io.BytesIO(record["preview_base"])).transpose(_TRANSPOSE[rotation])),
+        )
+    return {**record, "size": (width, height), "preview": preview, "rotation": rotation}
+
+
+def get_bytes(record) -> bytes:
+    """Bytes JPEG đầy đủ đã áp góc xoay (để chèn vào DOCX)."""
+    rotation = record.get("rotation", 0)
+    if not rotation:
+        return _STORE.get(record["digest"])
+
+    key = (record["digest"], rotation)
+    with _ROTATED_LOCK:
+        rotated_digest = _ROTATED.get(key)
+        if rotated_digest is not None:
+            _ROTATED.move_to_end(key)
+    if rotated_digest is not None:
+        try:
+            return _STORE.get(rotated_digest)
+        except KeyError:
+            pass
+
+    # xoay từ ảnh gốc → mỗi góc chỉ encode lại 1 lần, không giảm chất lượng theo số lần bấm
+    img = Image.open(io.BytesIO(_STORE.get(record["digest"])))
+    data = bytes_from_pil(img.transpose(_TRANSPOSE[rotation]))
+    rotated_digest = _STORE.put(data)
+    with _ROTATED_LOCK:
+        _ROTATED[key] = rotated_digest
+        _ROTATED.move_to_end(key)
+        while len(_ROTATED) > ROTATED_CACHE_SIZE:
+            _ROTATED.popitem(last=False)
+    return data
+
+
+def stats():
+    return _STORE.stats()
@@ -0,0 +1,226 @@
+# modules/metrics.py
+"""
+Bộ đếm / histogram trong process, xuất theo định dạng text của Prometheus.
+
+    REQUESTS = metrics.counter("bbnt_x_total", "Mô tả", ["kind"])
+    REQUESTS.inc(kind="a")
+    LATENCY = metrics.histogram("bbnt_x_seconds", "Mô tả", ["kind"])
+    LATENCY.observe(0.12, kind="a")
+
+Đọc số liệu (không ảnh hưởng tới app):
+- BBNT_METRICS_PORT=9108 → http://127.0.0.1:9108/metrics
+- BBNT_METRICS_FILE=/var/lib/node_exporter/bbnt.prom → ghi file định kỳ (textfile collector)
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FILE_INTERVAL = 15
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LOGGER = logging.getLogger("bbnt.metrics")
+
+_LOCK = threading.Lock()
+# tên metric -> Counter | Histogram, giữ thứ tự đăng ký
+_REGISTRY = {}
+_exporter_started = False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần đúng các label {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def expose(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self._header()
+        lines.extend(
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(v)}" for key, v in items
+        )
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [số lần rơi vào từng bucket (không cộng dồn) + bucket +Inf, tổng, số lần]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def expose(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        lines = self._header()
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip((*self.buckets, float("inf")), counts):
+                cumulative += c
+                labels = _format_labels(self.labelnames, key, [("le", _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+def _register(cls, name, *args, **kwargs):
+    with _LOCK:
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            metric = _REGISTRY[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric {name} đã đăng ký với kiểu khác")
+        return metric
+
+
+def counter(name, help_text, labelnames=()):
+    """Lấy / tạo counter; gọi lại cùng tên (vd. Streamlit chạy lại module) trả về đúng counter cũ."""
+    return _register(Counter, name, help_text, labelnames)
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help_text, labelnames, buckets)
+
+
+def render_text() -> str:
+    with _LOCK:
+        registered = list(_REGISTRY.values())
+    lines = []
+    for metric in registered:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """Ghi file tạm rồi đổi tên → scraper không đọc phải file dở dang."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(render_text(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _write_loop(path, interval):
+    while True:
+        try:
+            write_textfile(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+def start_exporter(port=None, path=None, host="127.0.0.1"):
+    """
+    Bật endpoint HTTP và/hoặc ghi file theo BBNT_METRICS_PORT / BBNT_METRICS_FILE.
+    Gọi nhiều lần (mỗi lượt chạy Streamlit) chỉ khởi động 1 lần trong process.
+    Không mở được cổng thì ghi cảnh báo vào log, không raise.
+    """
+    global _exporter_started
+    port = port or os.environ.get("BBNT_METRICS_PORT")
+    path = path or os.environ.get("BBNT_METRICS_FILE")
+    with _LOCK:
+        if _exporter_started or not (port or path):
+            return
+        _exporter_started = True
+
+    if port:
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _Handler)
+        except (OSError, ValueError) as exc:
+            # cổng đã bị chiếm (vd. 2 process Streamlit) → bỏ endpoint, app vẫn chạy bình thường
+            LOGGER.warning("Không mở được endpoint metrics %s:%s: %s", host, port, exc)
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    if path:
+        threading.Thread(target=_write_loop, args=(path, FILE_INTERVAL), name="metrics-file", daemon=True).start()
@@ -0,0 +1,224 @@
+# modules/render.py
+"""
+Tạo file DOCX biên bản từ template + dữ liệu đã format + ảnh.
+
+Kết quả được nhớ trong process (LRU, giới hạn theo dung lượng), khoá theo mọi thứ ảnh hưởng tới file:
+sha256 template, giá trị các trường, sha256 + góc xoay từng ảnh, chế độ upload ảnh.
+Bấm tạo lại cùng 1 biên bản (kiểm tra, tải lại sau rerun) trả bytes có sẵn, không render lại.
+
+Render chạy trong pool thread của process (tối đa RENDER_WORKERS biên bản cùng lúc):
+submit() trả về RenderJob để giữ trong session, UI đọc job.stage / job.done() rồi rerun.
+Cùng 1 biên bản bấm nhiều lần chỉ chạy 1 job.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from modules import docx_image_safe as ds
+from modules import image_store, metrics, timing
+from modules.report import TEXT_PLACEHOLDERS
+
+CACHE_BUDGET = 64 * 1024 * 1024
+IMAGE_WIDTH_CM = 12
+RENDER_WORKERS = 2
+STAGES = ("queued", "load", "text", "images", "save", "done")
+
+# key -> bytes DOCX
+_RESULTS = OrderedDict()
+_RESULTS_BYTES = 0
+_RESULTS_LOCK = threading.Lock()
+# key -> RenderJob đang chạy (để gộp các lần bấm trùng)
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+_POOL = None
+
+RENDER_SECONDS = metrics.histogram(
+    "bbnt_report_render_seconds", "Thời gian tạo 1 file DOCX biên bản", ["outcome"],
+)
+RENDER_CACHE = metrics.counter(
+    "bbnt_cache_requests_total", "Số lần đọc cache theo kết quả", ["cache", "result"],
+)
+RENDER_JOBS = metrics.counter(
+    "bbnt_report_jobs_total", "Số lần bấm tạo biên bản theo cách xử lý", ["result"],
+)
+
+
+def report_key(template_digest, text_values, images, upload_later) -> str:
+    """images: {số ảnh: (tên hạng mục, record image_store)}"""
+    payload = {
+        "template": template_digest,
+        "text": sorted((str(k), str(v)) for k, v in text_values.items()),
+        "images": sorted(
+            (no, title, record["digest"], record.get("rotation", 0))
+            for no, (title, record) in images.items()
+        ),
+        "upload_later": bool(upload_later),
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def get_cached(key):
+    with _RESULTS_LOCK:
+        data = _RESULTS.get(key)
+        if data is not None:
+            _RESULTS.move_to_end(key)
+    RENDER_CACHE.inc(cache="report", result="miss" if data is None else "hit")
+    return data
+
+
+def put_cached(key, data: bytes):
+    global _RESULTS_BYTES
+    if len(data) > CACHE_BUDGET:
+        return
+    with _RESULTS_LOCK:
+        old = _RESULTS.pop(key, None)
+        if old is not None:
+            _RESULTS_BYTES -= len(old)
+        _RESULTS[key] = data
+        _RESULTS_BYTES += len(data)
+        while _RESULTS_BYTES > CACHE_BUDGET:
+            _, evicted = _RESULTS.popitem(last=False)
+            _RESULTS_BYTES -= len(evicted)
+
+
+def text_values_for(template_path, values):
+    """Chỉ giữ các trường template thật sự có (theo manifest)."""
+    manifest = ds.template_manifest(template_path, TEXT_PLACEHOLDERS)
+    return {k: v for k, v in values.items() if k in manifest["text"]}
+
+
+def _no_progress(stage):
+    pass
+
+
+def render_report(template_path, text_values, images, progress=_no_progress) -> bytes:
+    started = time.perf_counter()
+    try:
+        data = _render_report(template_path, text_values, images, progress)
+    except Exception:
+        RENDER_SECONDS.observe(time.perf_counter() - started, outcome="error")
+        raise
+    RENDER_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+    return data
+
+
+def _render_report(template_path, text_values, images, progress):
+    progress("load")
+    with timing.stage("load") as s:
+        manifest = ds.template_manifest(template_path, TEXT_PLACEHOLDERS)
+        # bytes template được cache (đọc file + sha256 1 lần); Document thì parse lại mỗi lần render
+        doc = ds.load_template(template_path)
+        # duyệt paragraph 1 lần (cả bảng lồng nhau, header, footer), replace và chèn ảnh dùng chung
+        doc_index = ds.DocumentIndex(doc)
+        s.set(paragraphs=len(doc_index))
+
+    progress("text")
+    with timing.stage("text", count=len(text_values)) as s:
+        if text_values:
+            s.set(hits=len(ds.replace_many(doc, text_values, index=doc_index)))
+
+    progress("images")
+    with timing.stage("images", count=len(images)) as s:
+        # tìm placeholder + bảng hình ảnh 1 lần cho tất cả ảnh
+        images_to_insert = {
+            no: (title, image_store.get_bytes(record))
+            for no, (title, record) in images.items()
+        }
+        ds.insert_images(
+            doc, images_to_insert, IMAGE_WIDTH_CM, index=doc_index, scan_placeholders=bool(manifest["images"]),
+        )
+        s.set(bytes=sum(len(data) for _, data in images_to_insert.values()))
+
+    progress("save")
+    with timing.stage("save") as s:
+        data = ds.save_docx(doc)
+        s.set(bytes=len(data))
+    return data
+
+
+class RenderJob:
+    """Handle của 1 lần render; giữ trong session_state, không chứa gì của Streamlit."""
+
+    def __init__(self, key, timed=False):
+        self.key = key
+        self.stage = "queued"
+        self.submitted_at = time.time()
+        self.future = Future()
+        self.timed = timed
+        # kết quả modules/timing khi job được đo thời gian
+        self.timings = None
+
+    def set_stage(self, stage):
+        self.stage = stage
+
+    @property
+    def progress(self):
+        return STAGES.index(self.stage) / (len(STAGES) - 1)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """bytes DOCX; job lỗi thì raise lại lỗi của job."""
+        return self.future.result()
+
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+
+def _get_pool():
+    global _POOL
+    with _JOBS_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="report-render")
+        return _POOL
+
+
+def _run_job(job, template_path, text_values, images):
+    try:
+        with timing.trace("render", enabled=job.timed or None, key=job.key[:12]) as tr:
+            data = render_report(template_path, text_values, images, progress=job.set_stage)
+        if tr is not None:
+            tr.fields["queued_ms"] = round((time.time() - job.submitted_at) * 1000 - tr.total_ms, 2)
+            job.timings = tr.to_dict()
+        put_cached(job.key, data)
+        job.set_stage("done")
+        job.future.set_result(data)
+    except Exception as exc:
+        job.future.set_exception(exc)
+    finally:
+        with _JOBS_LOCK:
+            if _JOBS.get(job.key) is job:
+                del _JOBS[job.key]
+
+
+def submit(template_path, text_values, images, upload_later, timed=False) -> RenderJob:
+    """
+    Đưa 1 biên bản vào hàng đợi render. Đã có trong cache → job xong ngay;
+    đang có job cùng key → trả lại đúng job đó.
+    timed=True: đo thời gian từng bước (job.timings) dù không bật BBNT_TIMING.
+    """
+    key = report_key(ds.template_digest(template_path), text_values, images, upload_later)
+    data = get_cached(key)
+    if data is not None:
+        job = RenderJob(key, timed)
+        if timed:
+            job.timings = {"name": "render", "key": key[:12], "cache": "hit", "total_ms": 0.0, "stages": []}
+        job.set_stage("done")
+        job.future.set_result(data)
+        RENDER_JOBS.inc(result="cached")
+        return job
+
+    with _JOBS_LOCK:
+        job = _JOBS.get(key)
+        if job is not None:
+            RENDER_JOBS.inc(result="coalesced")
+            return job
+        job = _JOBS[key] = RenderJob(key, timed)
+    RENDER_JOBS.inc(result="submitted")
+    _get_pool().submit(_run_job, job, template_path, text_values, images)
+    return job
+
@@ -0,0 +1,167 @@
+# modules/report.py
+import re
+import unicodedata
+from pathlib import Path
+
+import pandas as pd
+
+# Danh sách placeholder chữ trong template
+TEXT_PLACEHOLDERS = [
+    "ngaybatdau", "ngayketthuc", "ngay_ky", "tu_ngay", "den_ngay",
+    "Chu_ha_tang", "Chuc_vu",
+    "Danh_gia_DH", "Danh_gia_PM", "Danh_gia_cot",
+    "Dia_chi", "Ky_thanh_toan",
+    "Loai_cot", "Loai_tram",
+    "Ma_HD", "Ten_GD_VT", "Ten_don_vi_XHH",
+    "ma_tram", "tien_bang_chu",
+    "tienthangtruocthue", "tienthueky",
+    "tientruocthueky", "tongtienky",
+]
+
+# Các cột cần đọc từ CSDL / Taichinh (so khớp theo normalize_key)
+DATA_FIELDS = TEXT_PLACEHOLDERS + [
+    "ma_tram", "Password", "Ma_vi_tri", "Thang",
+    "Phong_may", "Dieu_hoa",
+]
+
+DATE_FIELDS = {"ngaybatdau", "ngayketthuc", "ngayky", "tungay", "denngay"}
+MONEY_FIELDS = {
+    "tienthangtruocthue",
+    "tienthueky",
+    "tientruocthueky",
+    "tongtienky",
+}
+
+
+def normalize_key(value):
+    return str(value).lower().replace("_", "").replace(" ", "")
+
+
+def normalize_text(value):
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d) để so khớp tên."""
+    text = "" if value is None else str(value)
+    text = text.strip().lower()
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d")
+
+
+def match_image_slot(filename, rules):
+    """
+    Đoán số thứ tự ảnh từ tên file: anh3.jpg, Ảnh 3.jpg, hinh_03.png, 3_mong_M0.jpg, 03.jpg ...
+    Tên file của máy ảnh / điện thoại (IMG_0007.jpg, 0007.jpg) không phải số ảnh → không đoán.
+    Không có số thì so theo tên hạng mục (vd. mong_m0.jpg -> Móng M0). Không đoán được -> None.
+    """
+    stem = normalize_text(Path(str(filename)).stem)
+    numbers = {rule["no"] for rule in rules}
+
+    m = re.match(r"^(?:(?:anh|hinh)[\s_.-]*0*(\d{1,2})|0?(\d{1,2}))(?!\d)", stem)
+    if m and int(m.group(1) or m.group(2)) in numbers:
+        return int(m.group(1) or m.group(2))
+
+    words = re.sub(r"[^a-z0-9]+", " ", stem).strip()
+    for rule in sorted(rules, key=lambda r: len(r["title"]), reverse=True):
+        title = re.sub(r"[^a-z0-9]+", " ", normalize_text(rule["title"])).strip()
+        if title and f" {title} " in f" {words} ":
+            return rule["no"]
+    return None
+
+
+def format_vn_number(value, decimals=0):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    text = str(value).strip()
+    if not text:
+        return ""
+    try:
+        number = pd.to_numeric(text.replace(".", "").replace(",", "."), errors="raise")
+    except Exception:
+        return text
+    if decimals == 0:
+        return f"{int(round(float(number))):,}".replace(",", ".")
+    formatted = f"{float(number):,.{decimals}f}"
+    return formatted.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def format_vn_money(value):
+    return format_vn_number(value, decimals=0)
+
+
+def format_vn_date(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+
+    if isinstance(value, (int, float)) and value > 25000:
+        try:
+            base = pd.to_datetime("1899-12-30")
+            dt = base + pd.to_timedelta(int(value), "D")
+            return dt.strftime("%d/%m/%Y")
+        except Exception:
+            pass
+
+    try:
+        dt = pd.to_datetime(value, dayfirst=True, errors="coerce")
+        if not pd.isna(dt):
+            return dt.strftime("%d/%m/%Y")
+    except Exception:
+        pass
+
+    return str(value)
+
+
+def format_value_for_field(key, value):
+    key_norm = normalize_key(key)
+    if key_norm in MONEY_FIELDS:
+        return format_vn_money(value)
+    if key_norm in DATE_FIELDS:
+        return format_vn_date(value)
+    if key_norm == "kythanhtoan":
+        return format_vn_number(value)
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value)
+
+
+def build_formatted_data(data):
+    return {k: format_value_for_field(k, v) for k, v in data.items()}
+
+
+def build_data_index(df_csdl, df_taichinh):
+    """
+    Index tra cứu O(1), build 1 lần cùng lúc với load dữ liệu:
+    - tram: {MA_TRAM: vị trí dòng trong CSDL} (dòng đầu tiên nếu trùng)
+    - thang_rows: {(MA_TRAM, Thang): vị trí dòng trong Taichinh}
+    - thang_list: danh sách tháng đã sort cho ô chọn lúc đăng nhập
+    """
+    tram = {}
+    for pos, value in enumerate(df_csdl["ma_tram"].tolist()):
+        tram.setdefault(str(value).strip().upper(), pos)
+
+    thang_rows = {}
+    ma_vi_tri = df_taichinh["Ma_vi_tri"].astype(str).str.upper().tolist()
+    thang_col = df_taichinh["Thang"].astype(str).tolist()
+    for pos, key in enumerate(zip(ma_vi_tri, thang_col)):
+        thang_rows.setdefault(key, pos)
+
+    return {
+        "tram": tram,
+        "thang_rows": thang_rows,
+        "thang_list": sorted(set(thang_col)),
+    }
+
+
+def build_user_data(csdl_row: dict, taichinh_row: dict, thang: str):
+    user_data = dict(csdl_row)
+    user_data.update(taichinh_row)
+    user_data["Thang"] = thang
+
+    # auto fields
+    loai_cot = str(user_data.get("Loai_cot", "")).strip().lower()
+    user_data["Danh_gia_cot"] = "Đạt" if loai_cot == "cột dây co" else "Không đánh giá"
+    user_data["Danh_gia_PM"] = "Đạt" if str(user_data.get("Phong_may","")) != "Không thuê" else "Không đánh giá"
+    user_data["Danh_gia_DH"] = "Đạt" if str(user_data.get("Dieu_hoa","")) != "Không thuê" else "Không đánh giá"
+    return user_data
+
+
+def build_text_values(user_data, holders=TEXT_PLACEHOLDERS):
+    """{placeholder: giá trị đã format} cho toàn bộ placeholder chữ."""
+    normalized_map = {normalize_key(k): format_value_for_field(k, v) for k, v in user_data.items()}
+    return {holder: normalized_map.get(normalize_key(holder), "") for holder in holders}
@@ -0,0 +1,183 @@
+# modules/retry.py
+"""
+Thử lại lệnh gọi Google API và giới hạn tốc độ gọi phía client.
+
+- Phân loại lỗi (error_class): chỉ thử lại 429 / 5xx / hết quota theo phút / timeout / lỗi đường truyền,
+  các lỗi 4xx khác (sai quyền, sai id, request hỏng) trả lỗi ngay.
+- Backoff luỹ thừa + full jitter: chờ random(0, min(cap, base * 2^lần)) → các worker không cùng thử lại 1 lúc.
+- Deadline: tổng thời gian (kể cả chờ) không vượt quá policy.deadline.
+- Token bucket theo từng API (sheets / drive / docs), dùng chung cả process:
+  giữ số lệnh / giây dưới quota thay vì để Google trả 429 rồi mới lùi lại.
+"""
+import http.client
+import random
+import socket
+import ssl
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from modules import metrics
+
+RETRYABLE = frozenset({"http_408", "http_429", "http_5xx", "rate_limit", "timeout", "connection"})
+# (lệnh / giây, burst) cho mỗi process; quota mặc định của Google: Sheets và Docs 60 lệnh/phút/user
+RATE_LIMITS = {
+    "sheets": (1.0, 10),
+    "docs": (1.0, 10),
+    "drive": (10.0, 20),
+}
+
+RETRIES = metrics.counter(
+    "bbnt_google_api_retries_total", "Số lần thử lại lệnh gọi Google API", ["api", "error_class"],
+)
+GIVE_UPS = metrics.counter(
+    "bbnt_google_api_give_ups_total", "Số lệnh gọi bỏ cuộc sau khi thử lại", ["api", "reason"],
+)
+THROTTLED = metrics.counter(
+    "bbnt_google_api_throttled_seconds_total", "Tổng thời gian chờ token bucket", ["api"],
+)
+
+_RATE_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "RATE_LIMIT_EXCEEDED")
+
+
+def _status_and_body(exc):
+    if isinstance(exc, HttpError):
+        body = exc.content.decode("utf-8", "replace") if isinstance(exc.content, bytes) else str(exc.content)
+        return int(getattr(exc.resp, "status", 0) or 0), body
+    response = getattr(exc, "response", None)  # gspread.APIError, requests.HTTPError
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return int(status), getattr(response, "text", "") or ""
+    return None, ""
+
+
+def error_class(exc) -> str:
+    """Nhóm lỗi để đếm / quyết định retry: http_429, http_5xx, rate_limit, http_404, timeout, connection, ..."""
+    status, body = _status_and_body(exc)
+    if status is not None:
+        if status >= 500:
+            return "http_5xx"
+        # Drive / Sheets báo hết quota theo phút bằng 403 kèm reason
+        if status == 403 and any(reason in body for reason in _RATE_REASONS):
+            return "rate_limit"
+        return f"http_{status}"
+    if isinstance(exc, TimeoutError) or "timeout" in type(exc).__name__.lower():
+        return "timeout"
+    if _is_transport_error(exc):
+        return "connection"
+    # OSError còn lại (PermissionError, đầy đĩa, ...) là lỗi máy mình → không thử lại
+    return type(exc).__name__
+
+
+def _is_transport_error(exc):
+    """Lỗi đường truyền tới Google: đứt / từ chối kết nối, DNS, TLS, phản hồi HTTP hỏng."""
+    if isinstance(exc, ssl.SSLCertVerificationError):
+        return False
+    if isinstance(exc, (ConnectionError, socket.gaierror, ssl.SSLError, http.client.HTTPException)):
+        return True
+    # httplib2 (googleapiclient), requests / urllib3 (gspread): xét theo module để không phải import
+    module = type(exc).__module__.split(".")[0]
+    name = type(exc).__name__
+    if module == "httplib2":
+        return name in ("ServerNotFoundError", "HttpLib2Error")
+    return module in ("requests", "urllib3") and "Connection" in name
+
+
+def is_retryable(exc) -> bool:
+    return error_class(exc) in RETRYABLE
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=6, base=0.5, cap=20.0, deadline=60.0, retryable=RETRYABLE,
+                 sleep=time.sleep, clock=time.monotonic, rand=random.random):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.retryable = retryable
+        self._sleep = sleep
+        self._clock = clock
+        self._rand = rand
+
+    def backoff(self, attempt):
+        """Thời gian chờ trước lần thử thứ attempt + 1 (full jitter)."""
+        return self._rand() * min(self.cap, self.base * 2 ** (attempt - 1))
+
+    def pause(self, attempt):
+        """Chờ backoff(attempt) giây (dùng khi tự điều khiển vòng thử lại, vd. batch)."""
+        self._sleep(self.backoff(attempt))
+
+    def call(self, func, api="google"):
+        started = self._clock()
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as exc:
+                attempt += 1
+                cls = error_class(exc)
+                if cls not in self.retryable:
+                    raise
+                if attempt >= self.max_attempts:
+                    GIVE_UPS.inc(api=api, reason="attempts")
+                    raise
+                delay = self.backoff(attempt)
+                if self._clock() - started + delay > self.deadline:
+                    GIVE_UPS.inc(api=api, reason="deadline")
+                    raise
+                RETRIES.inc(api=api, error_class=cls)
+                self._sleep(delay)
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+class TokenBucket:
+    """rate token / giây, tối đa capacity token; acquire() chờ tới khi có token."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        # trừ trước rồi trả về thời gian phải chờ → các thread xếp hàng, không tranh nhau
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Trả về số giây đã chờ."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def limiter(api):
+    """Token bucket dùng chung cho 1 API; API không có trong RATE_LIMITS thì không giới hạn (None)."""
+    with _LIMITERS_LOCK:
+        if api not in _LIMITERS:
+            limits = RATE_LIMITS.get(api)
+            _LIMITERS[api] = TokenBucket(*limits) if limits else None
+        return _LIMITERS[api]
+
+
+def throttle(api):
+    bucket = limiter(api)
+    if bucket is not None:
+        waited = bucket.acquire()
+        if waited:
+            THROTTLED.inc(waited, api=api)
@@ -0,0 +1,157 @@
+# modules/timing.py
+"""
+Đo thời gian từng bước của 1 request (tải dữ liệu, điền chữ, chèn ảnh, lưu file, gọi Google ...).
+
+    with timing.trace("render", enabled=True) as tr:
+        with timing.stage("text") as s:
+            ...
+            s.set(count=len(hits))
+    tr.to_dict()  # {"name", "total_ms", "stages": [{"stage", "ms", ...}]}
+
+Chỉ đo khi thread hiện tại đang có trace; không có thì stage() trả về 1 object rỗng dùng chung,
+gần như không tốn gì. Bật mặc định cho mọi request bằng biến môi trường BBNT_TIMING=1.
+Mỗi trace xong ghi 1 dòng JSON vào logger "bbnt.timing".
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+ENABLED = os.environ.get("BBNT_TIMING") == "1"
+LOGGER = logging.getLogger("bbnt.timing")
+
+_LOCAL = threading.local()
+_LOGGER_LOCK = threading.Lock()
+_logger_ready = False
+
+
+def _setup_logger():
+    """
+    Mặc định logging chỉ ra WARNING → dòng JSON bị bỏ. Bật trace thì cho logger ra INFO,
+    thêm handler stderr nếu app chưa cấu hình handler nào.
+    """
+    global _logger_ready
+    with _LOGGER_LOCK:
+        if _logger_ready:
+            return
+        _logger_ready = True
+        if LOGGER.level == logging.NOTSET or LOGGER.level > logging.INFO:
+            LOGGER.setLevel(logging.INFO)
+        if not LOGGER.hasHandlers():
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+            LOGGER.addHandler(handler)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, trace, name, fields):
+        self._trace = trace
+        self.record = {"stage": name, **fields}
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["ms"] = round((time.perf_counter() - self._started) * 1000, 2)
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        self._trace.stages.append(self.record)
+        return False
+
+    def set(self, **fields):
+        """Ghi thêm số liệu cho bước đang đo (bytes, count, ...)."""
+        self.record.update(fields)
+
+
+class Trace:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.stages = []
+        self.total_ms = None
+
+    def to_dict(self):
+        return {"name": self.name, **self.fields, "total_ms": self.total_ms, "stages": list(self.stages)}
+
+
+class _TraceContext:
+    def __init__(self, name, fields):
+        self._trace = Trace(name, fields)
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_LOCAL, "trace", None)
+        _LOCAL.trace = self._trace
+        self._started = time.perf_counter()
+        return self._trace
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self._trace
+        trace.total_ms = round((time.perf_counter() - self._started) * 1000, 2)
+        if exc_type is not None:
+            trace.fields["error"] = exc_type.__name__
+        _LOCAL.trace = self._outer
+        if self._outer is not None:
+            # trace lồng trong trace khác → gộp thành 1 bước của trace ngoài
+            self._outer.stages.append({"stage": trace.name, "ms": trace.total_ms, "stages": trace.stages})
+        elif LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+        return False
+
+
+class _NullTrace:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TRACE = _NullTrace()
+
+
+def trace(name, enabled=None, **fields):
+    """Bắt đầu đo 1 request trên thread hiện tại; enabled=None → theo ENABLED. Tắt thì `as` nhận None."""
+    if not (ENABLED if enabled is None else enabled):
+        return _NULL_TRACE
+    if not _logger_ready:
+        _setup_logger()
+    return _TraceContext(name, fields)
+
+
+def stage(name, **fields):
+    trace_ = getattr(_LOCAL, "trace", None)
+    if trace_ is None:
+        return _NULL_STAGE
+    return _Stage(trace_, name, fields)
+
+
+def timed(name):
+    """Decorator: cả hàm là 1 bước."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_LOCAL, "trace", None) is None:
+                return fn(*args, **kwargs)
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
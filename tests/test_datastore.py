@@ -0,0 +1,55 @@
+import json
+import stat
+
+import pandas as pd
+import pytest
+
+for _name in ("gspread", "httplib2", "streamlit", "googleapiclient", "google_auth_httplib2"):
+    pytest.importorskip(_name)
+
+from modules import datastore  # noqa: E402
+
+
+def _frames():
+    df_csdl = pd.DataFrame({"ma_tram": ["HN1"], "Password": ["secret"]})
+    df_taichinh = pd.DataFrame({"Ma_vi_tri": ["HN1"], "Thang": ["01/2026"], "tongtienky": [1000]})
+    return df_csdl, df_taichinh
+
+
+def test_snapshot_is_private_to_owner(tmp_path):
+    path = tmp_path / "cache" / "sheets.sqlite"
+
+    datastore.save_snapshot(*_frames(), path=path, spreadsheet_id="sheet-a")
+
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+
+def test_snapshot_of_other_spreadsheet_is_rejected(tmp_path):
+    path = tmp_path / "sheets.sqlite"
+    datastore.save_snapshot(*_frames(), path=path, spreadsheet_id="sheet-a")
+
+    df_csdl, _, meta = datastore.load_snapshot(path, spreadsheet_id="sheet-a")
+    assert list(df_csdl["ma_tram"]) == ["HN1"]
+    assert meta["spreadsheet_id"] == "sheet-a"
+    assert datastore.load_snapshot(path, spreadsheet_id="sheet-b") is None
+    assert datastore.load_snapshot(path) is None
+
+
+def test_clear_removes_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "sheets.sqlite"
+    datastore.save_snapshot(*_frames(), path=path, spreadsheet_id="sheet-a")
+    monkeypatch.setattr(datastore, "SNAPSHOT_PATH", path)
+
+    datastore.clear()
+
+    assert not path.exists()
+
+
+def test_snapshot_keeps_column_layout(tmp_path):
+    path = tmp_path / "sheets.sqlite"
+    layout = {"CSDL": [[1, "ma_tram"], [4, "Password"]]}
+    datastore.save_snapshot(*_frames(), path=path, spreadsheet_id="sheet-a", column_layout=layout)
+
+    _, _, meta = datastore.load_snapshot(path, spreadsheet_id="sheet-a")
+
+    assert json.loads(meta["column_layout"]) == layout
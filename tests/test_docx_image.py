@@ -0,0 +1,36 @@
+import io
+import zipfile
+from pathlib import Path
+
+from modules import docx_image_safe as ds
+from modules.docx_image import CompiledTemplate
+from modules.report import TEXT_PLACEHOLDERS
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "template.docx"
+
+
+def _values():
+    values = {key: f"{key} = {i}" for i, key in enumerate(TEXT_PLACEHOLDERS)}
+    # ký tự đặc biệt của XML phải được escape, không làm hỏng document.xml
+    values["Dia_chi"] = 'Số 5 <Lô A> & "Tổ 3" \'B\''
+    values["Ten_don_vi_XHH"] = "Công ty A&B <TNHH>"
+    return values
+
+
+def _texts(doc):
+    return list(ds.DocumentIndex(doc).texts)
+
+
+def test_compiled_template_matches_replace_many():
+    template_bytes = TEMPLATE.read_bytes()
+    values = _values()
+
+    data = CompiledTemplate(template_bytes, TEXT_PLACEHOLDERS).render(values)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+    rendered = ds.load_docx_bytes(data)
+    expected = ds.load_docx_bytes(template_bytes)
+    ds.replace_many(expected, values)
+    assert _texts(rendered) == _texts(expected)
+    assert any(values["Dia_chi"] in text for text in _texts(rendered))
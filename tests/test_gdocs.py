@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import pytest
+
+for _name in ("googleapiclient", "gspread", "httplib2", "streamlit", "google_auth_httplib2"):
+    pytest.importorskip(_name)
+
+from modules import gdocs, gsheets, retry  # noqa: E402
+from modules.fakes import FakeDocs, FakeDrive, FakeSpreadsheet  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry, "throttle", lambda api: None)
+    for policy in (retry.DEFAULT_POLICY, gdocs._COPY_POLICY):
+        monkeypatch.setattr(policy, "_sleep", lambda seconds: None)
+
+
+@pytest.fixture
+def drive():
+    drive = FakeDrive()
+    drive.add_file("template", name="Mẫu", content="Trạm $Ma_tram - $Danh_gia_cot")
+    return drive
+
+
+def _export(drive, jobs, tmp_path):
+    return gdocs.export_many(jobs, tmp_path, max_workers=2, drive=drive, docs=FakeDocs(drive), http=drive.http())
+
+
+def test_export_many_writes_files_and_cleans_up(drive, tmp_path):
+    jobs = [("template", {"Ma_tram": f"HN{i}", "Loai_cot": "cột dây co"}, f"BBNT HN{i}") for i in range(3)]
+
+    results = _export(drive, jobs, tmp_path)
+
+    assert [r["error"] for r in results] == [None] * 3
+    assert Path(results[0]["path"]).read_text(encoding="utf-8") == "Trạm HN0 - Đạt"
+    assert drive.calls["files.copy"] == 3
+    # chỉ còn template, file tạm đã xoá bằng 1 batch
+    assert list(drive.meta) == ["template"]
+    assert drive.calls["batch"] == 1
+
+
+def test_export_many_keeps_duplicate_titles_apart(drive, tmp_path):
+    jobs = [("template", {"Ma_tram": code}, "BBNT") for code in ("A", "B", "C")]
+
+    results = _export(drive, jobs, tmp_path)
+
+    paths = [Path(r["path"]) for r in results]
+    assert [p.name for p in paths] == ["BBNT.docx", "BBNT-2.docx", "BBNT-3.docx"]
+    assert [p.read_text(encoding="utf-8").split(" - ")[0] for p in paths] == ["Trạm A", "Trạm B", "Trạm C"]
+
+
+def test_copy_is_not_retried_after_server_error(drive, tmp_path):
+    drive.fail("files.copy", 500)
+
+    results = _export(drive, [("template", {"Ma_tram": "A"}, "BBNT")], tmp_path)
+
+    assert results[0]["error"] is not None
+    assert drive.calls["files.copy"] == 1
+
+
+def test_copy_is_retried_after_rate_limit(drive, tmp_path):
+    drive.fail("files.copy", 429)
+
+    results = _export(drive, [("template", {"Ma_tram": "A"}, "BBNT")], tmp_path)
+
+    assert results[0]["error"] is None
+    assert drive.calls["files.copy"] == 2
+    assert list(drive.meta) == ["template"]
+
+
+def test_delete_drive_files_retries_transient_errors_and_ignores_missing(drive):
+    for i in range(3):
+        drive.add_file(f"tmp{i}")
+    drive.fail("files.delete", 503)
+
+    failed = gdocs.delete_drive_files(["tmp0", "tmp1", "tmp2", "gone"], drive=drive, http=drive.http())
+
+    assert failed == {}
+    assert list(drive.meta) == ["template"]
+    assert drive.calls["batch"] == 2
+
+
+def test_delete_drive_files_reports_permanent_errors(drive):
+    drive.add_file("tmp0")
+    drive.fail("files.delete", 400)
+
+    failed = gdocs.delete_drive_files(["tmp0"], drive=drive, http=drive.http())
+
+    assert list(failed) == ["tmp0"]
+    assert drive.calls["batch"] == 1
+
+
+def test_load_dataframes_if_changed_skips_unchanged_sheet(drive):
+    sh = FakeSpreadsheet({"CSDL": [{"Ma_tram": "A1"}], "Taichinh": [{"Ma_tram": "A1", "Tien": 5}]})
+    drive.add_file(sh.id)
+
+    loaded, version = gsheets.load_dataframes_if_changed(drive=drive, sh=sh, spreadsheet_id=sh.id, http=drive.http())
+    assert list(loaded[0]["Ma_tram"]) == ["A1"]
+
+    again, same = gsheets.load_dataframes_if_changed(version, drive=drive, sh=sh, spreadsheet_id=sh.id, http=drive.http())
+    assert again is None and same == version
+    assert sh.calls["get_all_records"] == 2
+
+    sh.set_records("CSDL", [{"Ma_tram": "B2"}], drive=drive)
+    changed, new_version = gsheets.load_dataframes_if_changed(version, drive=drive, sh=sh, spreadsheet_id=sh.id, http=drive.http())
+    assert new_version != version
+    assert list(changed[0]["Ma_tram"]) == ["B2"]
@@ -0,0 +1,71 @@
+import pytest
+
+for _name in ("gspread", "httplib2", "streamlit", "googleapiclient", "google_auth_httplib2"):
+    pytest.importorskip(_name)
+
+from modules import gsheets, retry  # noqa: E402
+from modules.fakes import FakeSpreadsheet  # noqa: E402
+
+FIELDS = ["ma_tram", "Tien"]
+
+
+@pytest.fixture(autouse=True)
+def no_throttle(monkeypatch):
+    monkeypatch.setattr(retry, "throttle", lambda api: None)
+
+
+def _spreadsheet(spreadsheet_id):
+    return FakeSpreadsheet(
+        {
+            "CSDL": [{"Ma_tram": "A1", "Ten": "x"}, {"Ma_tram": "A2", "Ten": "y"}],
+            "Taichinh": [{"Ma tram": "A1", "Tien": "5"}],
+        },
+        spreadsheet_id=spreadsheet_id,
+    )
+
+
+def test_projected_cold_start_uses_one_batch_get():
+    sh = _spreadsheet("cold-start")
+
+    df_csdl, df_taichinh, _ = gsheets.load_dataframes_projected(FIELDS, sh)
+
+    assert sh.calls["values_batch_get"] == 1
+    assert list(df_csdl.columns) == ["Ma_tram"]
+    assert list(df_csdl["Ma_tram"]) == ["A1", "A2"]
+    assert df_taichinh.to_dict("records") == [{"Ma tram": "A1", "Tien": 5}]
+
+    gsheets.load_dataframes_projected(FIELDS, sh)
+    assert sh.calls["values_batch_get"] == 2
+
+
+def test_projected_rereads_when_header_moves():
+    sh = _spreadsheet("header-moves")
+    gsheets.load_dataframes_projected(FIELDS, sh)
+    sh.set_records("CSDL", [{"Ten": "x", "Ma_tram": "B1"}])
+
+    df_csdl, _, _ = gsheets.load_dataframes_projected(FIELDS, sh)
+
+    assert list(df_csdl["Ma_tram"]) == ["B1"]
+    assert sh.calls["values_batch_get"] == 3
+
+
+def test_seeded_layout_skips_cold_range():
+    warm = _spreadsheet("seeded-source")
+    gsheets.load_dataframes_projected(FIELDS, warm)
+    saved = gsheets.column_layout("seeded-source")
+
+    sh = _spreadsheet("seeded")
+    gsheets.seed_column_layout("seeded", saved)
+    ranges = []
+    original = sh.values_batch_get
+
+    def spy(requested, params=None):
+        ranges.extend(requested)
+        return original(requested, params)
+
+    sh.values_batch_get = spy
+    df_csdl, _, _ = gsheets.load_dataframes_projected(FIELDS, sh)
+
+    assert list(df_csdl["Ma_tram"]) == ["A1", "A2"]
+    assert sh.calls["values_batch_get"] == 1
+    assert not any(r.endswith(gsheets.COLD_RANGE) for r in ranges)
@@ -0,0 +1,36 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from modules import image_store
+from modules.image_store import BlobStore
+
+
+def test_blob_store_deletes_least_recently_used_spill_files(tmp_path):
+    store = BlobStore(budget=10, spill_dir=str(tmp_path), disk_budget=25)
+    digests = [store.put(bytes([i]) * 10) for i in range(5)]
+
+    # 1 blob trong RAM, tối đa 2 file (20 byte) trên đĩa
+    assert len(os.listdir(tmp_path)) == 2
+    assert store.stats()["disk_bytes"] <= 25
+    assert store.get(digests[-1]) == bytes([4]) * 10
+    assert store.get(digests[-2]) == bytes([3]) * 10
+    with pytest.raises(KeyError):
+        store.get(digests[0])
+
+
+def test_rotated_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(image_store, "_ROTATED", image_store.OrderedDict())
+    monkeypatch.setattr(image_store, "ROTATED_CACHE_SIZE", 2)
+
+    records = []
+    for color in ("red", "green", "blue"):
+        buf = io.BytesIO()
+        Image.new("RGB", (32, 16), color).save(buf, format="JPEG")
+        records.append(image_store.rotate(image_store.ingest(buf.getvalue()), 90))
+    for record in records:
+        assert Image.open(io.BytesIO(image_store.get_bytes(record))).size == (16, 32)
+
+    assert len(image_store._ROTATED) == 2
@@ -0,0 +1,17 @@
+import logging
+import socket
+
+from modules import metrics
+
+
+def test_start_exporter_survives_port_in_use(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "_exporter_started", False)
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        port = busy.getsockname()[1]
+
+        with caplog.at_level(logging.WARNING, logger="bbnt.metrics"):
+            metrics.start_exporter(port=port)
+
+    assert any("metrics" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,48 @@
+import io
+import zipfile
+from pathlib import Path
+
+from PIL import Image
+
+from modules import docx_image_safe as ds
+from modules import image_store, render
+from modules.report import TEXT_PLACEHOLDERS
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "template.docx"
+
+
+def _jpeg(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _picture_count(docx_bytes):
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        return z.read("word/document.xml").decode("utf-8").count("<pic:pic")
+
+
+def test_rendered_report_keeps_pictures_after_manifest():
+    # report tab đọc manifest trước khi render (mỗi lần rerun)
+    ds.template_manifest(TEMPLATE, TEXT_PLACEHOLDERS)
+    images = {
+        1: ("Toàn cảnh", image_store.ingest(_jpeg((200, 0, 0)))),
+        3: ("Móng M0", image_store.ingest(_jpeg((0, 200, 0)))),
+    }
+
+    data = render.render_report(TEMPLATE, {}, images)
+
+    assert _picture_count(data) == 2
+    # lần render thứ 2 (template đã nằm trong cache) vẫn đủ ảnh
+    assert _picture_count(render.render_report(TEMPLATE, {}, images)) == 2
+
+
+
+def test_load_template_returns_independent_documents():
+    first = ds.load_template(TEMPLATE)
+    first.add_paragraph("chỉ có trong bản 1")
+    second = ds.load_template(TEMPLATE)
+
+    assert "chỉ có trong bản 1" not in [p.text for p in second.paragraphs]
+    saved = ds.load_docx_bytes(ds.save_docx(first))
+    assert "chỉ có trong bản 1" in [p.text for p in saved.paragraphs]
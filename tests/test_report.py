@@ -0,0 +1,40 @@
+import pytest
+
+from modules.report import match_image_slot, normalize_text
+
+RULES = [
+    {"no": 1, "title": "Toàn cảnh trạm"},
+    {"no": 3, "title": "Móng M0"},
+    {"no": 7, "title": "Tiếp địa"},
+    {"no": 12, "title": "Hình ảnh điều hòa"},
+]
+
+
+def test_normalize_text_strips_vietnamese_marks():
+    assert normalize_text("  Ảnh Điều Hòa ") == "anh dieu hoa"
+    assert normalize_text(None) == ""
+
+
+@pytest.mark.parametrize("filename, slot", [
+    ("anh3.jpg", 3),
+    ("Ảnh 3.jpg", 3),
+    ("hinh_03.png", 3),
+    ("3_mong_M0.jpg", 3),
+    ("03.jpg", 3),
+    ("12.jpeg", 12),
+    ("mong_m0.jpg", 3),
+    ("tiep-dia.png", 7),
+])
+def test_match_image_slot_documented_names(filename, slot):
+    assert match_image_slot(filename, RULES) == slot
+
+
+@pytest.mark.parametrize("filename", [
+    "IMG_0007.jpg",
+    "0007.jpg",
+    "img_03.png",
+    "anh5.jpg",  # không có ô ảnh 5
+    "DSC01234.JPG",
+])
+def test_match_image_slot_leaves_camera_names_for_manual_pick(filename):
+    assert match_image_slot(filename, RULES) is None
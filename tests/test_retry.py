@@ -0,0 +1,42 @@
+import errno
+import http.client
+import socket
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from modules import retry  # noqa: E402
+
+
+@pytest.mark.parametrize("exc", [
+    ConnectionResetError(),
+    BrokenPipeError(),
+    socket.gaierror(-2, "Name or service not known"),
+    http.client.RemoteDisconnected("closed"),
+    http.client.IncompleteRead(b""),
+])
+def test_transport_errors_are_retried(exc):
+    assert retry.error_class(exc) == "connection"
+    assert retry.is_retryable(exc)
+
+
+@pytest.mark.parametrize("exc", [
+    PermissionError(errno.EACCES, "denied"),
+    FileNotFoundError(errno.ENOENT, "missing"),
+    OSError(errno.ENOSPC, "No space left on device"),
+])
+def test_local_disk_errors_are_not_retried(exc):
+    assert not retry.is_retryable(exc)
+
+
+def test_policy_does_not_retry_permission_error():
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise PermissionError(errno.EACCES, "denied")
+
+    with pytest.raises(PermissionError):
+        retry.RetryPolicy(sleep=lambda s: None).call(fail)
+    assert len(calls) == 1
@@ -0,0 +1,20 @@
+import json
+import logging
+
+from modules import timing
+
+
+def test_trace_logs_json_line_at_default_level(caplog, monkeypatch):
+    # logger riêng cho test (mặc định NOTSET → WARNING như lúc app mới chạy), không đụng bbnt.timing thật
+    monkeypatch.setattr(timing, "LOGGER", logging.getLogger("bbnt.timing.test_default_level"))
+    monkeypatch.setattr(timing, "_logger_ready", False)
+
+    with timing.trace("render", enabled=True, key="abc"):
+        with timing.stage("save") as s:
+            s.set(bytes=10)
+
+    records = [r for r in caplog.records if r.name == timing.LOGGER.name]
+    assert len(records) == 1
+    line = json.loads(records[0].getMessage())
+    assert line["key"] == "abc"
+    assert line["stages"][0]["stage"] == "save"